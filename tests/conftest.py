@@ -0,0 +1,60 @@
+import os
+import sys
+import pytest
+
+# The grader is a set of top-level modules, not an installed package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import typealong_grader
+
+REFERENCE = """// Teacher
+public class Counter
+{
+    public static void main(String[] args)
+    {
+        int count = 0;
+        for (int i = 0; i < 10; i++)
+        {
+            count += i;
+        }
+        System.out.println(count);
+    }
+}
+"""
+
+@pytest.fixture
+def type_along(tmp_path):
+    """A reference solution and 40 students, each with their own spacing mistakes, as (reference path, students).
+
+    Students are (name, path, code) entries, as find_java_files gives them,
+    and every student's header comment holds their name.
+    """
+    reference = tmp_path / "Reference.java"
+    reference.write_text(REFERENCE)
+    directory = tmp_path / "students"
+    directory.mkdir()
+    students = []
+    for number in range(40):
+        path = directory / f"Student{number:02}.java"
+        code = (REFERENCE.replace("// Teacher", f"// Student{number}")
+                .replace("count += i;", "count += i;" + " " * number))
+        path.write_text(code)
+        students.append((f"Student{number}", str(path), code))
+    return str(reference), students
+
+@pytest.fixture
+def crash_on_student_7(monkeypatch):
+    """A function that makes grading kill its process at Student7's file, as a crashing worker would.
+
+    Only worker processes forked after it is called crash, so call it once
+    the expected grades have been worked out in this process.
+    """
+    def crash():
+        grade_java_code = typealong_grader.grade_java_code
+
+        def crashing(source, student, **settings):
+            if "// Student7\n" in student:
+                os._exit(1)
+            return grade_java_code(source, student, **settings)
+
+        monkeypatch.setattr(typealong_grader, 'grade_java_code', crashing)
+    return crash
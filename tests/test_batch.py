@@ -0,0 +1,27 @@
+import json
+import pytest
+from typealong_batch import load_manifest
+
+def write_manifest(tmp_path, entries):
+    path = tmp_path / "manifest.json"
+    path.write_text(json.dumps(entries))
+    return str(path)
+
+def test_manifest_keeps_a_zero_penalty_and_names_assignments_by_their_path(tmp_path):
+    assignments = load_manifest(write_manifest(tmp_path, [
+        {"source_code": "Ref.java", "student_directory": "a/submissions", "total_points": 10,
+         "points_per_mistake": 0},
+        {"source_code": "Ref.java", "student_directory": "b/submissions", "total_points": 10}]))
+    assert [(assignment.name, assignment.points_per_mistake) for assignment in assignments] == \
+        [("a/submissions", 0), ("b/submissions", 0.1)]
+
+@pytest.mark.parametrize('entries, error', [
+    ([{"source_code": "Ref.java", "student_directory": "a", "total_points": 10, "points_per_mistake": "abc"}],
+     "entry 1 is invalid"),
+    ([{"source_code": "Ref.java", "student_directory": "a", "total_points": 10},
+      {"source_code": "Ref.java", "student_directory": "a/", "total_points": 5}],
+     "entry 2 has the same name"),
+])
+def test_manifest_errors_name_the_entry(tmp_path, entries, error):
+    with pytest.raises(ValueError, match=error):
+        load_manifest(write_manifest(tmp_path, entries))
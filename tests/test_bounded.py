@@ -0,0 +1,27 @@
+from typealong_grader import grade_java_code, grade_typealong
+
+REFERENCE = "// Teacher\npublic class Counter\n{\n    int count = 0;\n}\n"
+WRONG_FILE = "// Student\npublic class X{}\n"
+
+def test_max_edits_alone_scores_a_wrong_file_0(tmp_path):
+    num_mistakes, mistake_tags = grade_java_code(REFERENCE, WRONG_FILE, max_edits=5)
+    assert mistake_tags[0] == "ExceedsThreshold"
+    # Only the mistakes the student is certain to have are counted
+    assert num_mistakes == grade_java_code(REFERENCE, WRONG_FILE, max_mistakes=0)[0] > 1
+
+    reference = tmp_path / "Reference.java"
+    reference.write_text(REFERENCE)
+    student = ("Student", str(tmp_path / "Student.java"), WRONG_FILE)
+    assert grade_typealong(str(reference), [student], 10, max_edits=5)[0][1] == 0
+    # With no penalty no number of mistakes scores 0, but the cut-off still does
+    assert grade_typealong(str(reference), [student], 10, points_per_mistake=0, max_edits=5)[0][1] == 0
+
+def test_bounded_grading_only_cuts_off_students_who_score_0(tmp_path):
+    reference = tmp_path / "Reference.java"
+    reference.write_text(REFERENCE)
+    close = ("Close", str(tmp_path / "Close.java"), REFERENCE.replace("count = 0", "count=0"))
+    wrong = ("Wrong", str(tmp_path / "Wrong.java"), WRONG_FILE)
+    full = grade_typealong(str(reference), [close, wrong], 1)
+    bounded = grade_typealong(str(reference), [close, wrong], 1, bounded=True)
+    assert bounded[0] == full[0] and full[0][1] > 0
+    assert full[1][1] == bounded[1][1] == 0 and bounded[1][2][0] == "ExceedsThreshold"
@@ -0,0 +1,126 @@
+import random
+import pytest
+from typealong_bench import generate_submission
+from typealong_grader import (RUN_ENGINES, PreparedReference, classify_runs, grade_java_code, myers_diff,
+                              process_diff_results, to_runs)
+
+# Lines that repeat in real Java files; drawing from few of them gives many duplicate lines
+LINES = ['{', '}', '', 'int x = 0;', '    y--;', 'x++;', '// c', 'System.out.println(x);', '    return a + b;']
+
+# Repeated lines the line diff of the hunks engine pairs up differently from the full diff
+REPEATED_LINES = ('// c\nint x = 0;\nx++;\n    y--;\n\n    y--;\n}\nint x = 0;\nint x = 0;\nint x = 0;\n    y--;',
+                  '// c\nint x = 0;\nx+;\n    y--;\n\n    y--;\n}\nint x = 0;\nint x = 0;\n    y--;')
+
+# A type-along of realistic length, for submissions generated as typealong_bench does
+GRADEBOOK = """// Teacher
+import java.util.ArrayList;
+import java.util.List;
+
+public class Gradebook
+{
+    private final List<Integer> scores = new ArrayList<>();
+
+    public void add(int score)
+    {
+        if (score < 0 || score > 100)
+        {
+            throw new IllegalArgumentException("Score out of range: " + score);
+        }
+        scores.add(score);
+    }
+
+    public double average()
+    {
+        if (scores.isEmpty())
+        {
+            return 0;
+        }
+        int total = 0;
+        for (int score : scores)
+        {
+            total += score;
+        }
+        return (double) total / scores.size();
+    }
+
+    public int highest()
+    {
+        int best = 0;
+        for (int score : scores)
+        {
+            if (score > best)
+            {
+                best = score;
+            }
+        }
+        return best;
+    }
+
+    public static void main(String[] args)
+    {
+        Gradebook book = new Gradebook();
+        book.add(90); // first test
+        book.add(72);
+        book.add(85);
+        System.out.println("Average: " + book.average());
+        System.out.println("Highest: " + book.highest());
+    }
+}
+"""
+
+def mutate(rng, text):
+    chars = list(text)
+    for _ in range(rng.randint(1, 4)):
+        position = rng.randrange(len(chars) + 1)
+        if rng.random() < 0.4 and chars:
+            del chars[min(position, len(chars) - 1)]
+        else:
+            chars.insert(position, rng.choice(' x;{}\n'))
+    return ''.join(chars)
+
+def cases(count=500, seed=4):
+    rng = random.Random(seed)
+    yield REPEATED_LINES
+    for _ in range(count):
+        lines = [rng.choice(LINES) for _ in range(rng.randint(3, 14))]
+        student = list(lines)
+        if rng.random() < 0.5:
+            del student[rng.randrange(len(student))]
+        yield '\n'.join(lines), mutate(rng, '\n'.join(student))
+
+def edits(runs):
+    return sum(len(text) for op, text in runs if op != 'same')
+
+@pytest.mark.parametrize('engine', ['classic', 'linear'])
+def test_exact_engines_match_the_full_diff(engine):
+    for reference, student in cases():
+        assert classify_runs(RUN_ENGINES[engine](reference, student)) == \
+            process_diff_results(myers_diff(reference, student)), (reference, student)
+
+def test_hunks_gives_a_valid_script_no_shorter_than_the_full_diff():
+    for reference, student in cases():
+        runs = RUN_ENGINES['hunks'](reference, student)
+        assert ''.join(text for op, text in runs if op != 'insert') == reference
+        assert ''.join(text for op, text in runs if op != 'delete') == student
+        assert edits(runs) >= edits(to_runs(myers_diff(reference, student)))
+
+def test_hunks_grades_generated_submissions_like_the_full_diff():
+    # REPEATED_LINES is the known exception; typed-along submissions do not pair lines up that way
+    reference = PreparedReference(GRADEBOOK, 'eol')
+    rng = random.Random(10)
+    for number in range(300):
+        student = generate_submission(GRADEBOOK, rng.choice((0.02, 0.05, 0.1)), rng, f"// Student{number}\n")
+        assert grade_java_code(reference, student, engine='hunks') == \
+            grade_java_code(reference, student, engine='linear'), student
+
+@pytest.mark.parametrize('engine', ['classic', 'linear', 'hunks'])
+def test_limit_gives_up_past_the_edit_distance(engine):
+    reference, student = REPEATED_LINES
+    distance = edits(to_runs(myers_diff(reference, student)))
+    assert RUN_ENGINES[engine](reference, student, limit=distance - 1) is None
+    assert RUN_ENGINES[engine](reference, student, limit=edits(RUN_ENGINES[engine](reference, student))) is not None
+
+def test_engines_grade_a_submission_alike():
+    reference = "public class A\n{\n    int x = 0;\n}\n"
+    student = "public class A {\n    int x=0;\n}\n"
+    assert grade_java_code(reference, student, engine='linear') == grade_java_code(reference, student, engine='classic')
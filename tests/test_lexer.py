@@ -0,0 +1,40 @@
+import pytest
+from typealong_grader import (find_bracket_errors, grade_java_code, lex_java, normalize_java_code,
+                              preprocess_java_code, strip_comments)
+
+def eol(code):
+    return normalize_java_code(strip_comments(lex_java(code), 'eol'))
+
+@pytest.mark.parametrize('code', [
+    'String url = "http://example.com"; // note\n',
+    "char c = '/'; /* a // b */ int x;\n",
+    'String s = "oops;\nint f() {\n}\n',
+])
+def test_lexing_gives_back_the_code(code):
+    assert ''.join(text for _, text in lex_java(code)) == code
+
+def test_slashes_in_strings_and_block_comments_are_not_line_comments():
+    assert eol('String url = "http://example.com"; // note') == 'String url = "http://example.com";'
+    assert eol('/* a // b */ int x;') == '/* a // b */ int x;'
+
+def test_eol_drops_a_trailing_comment_from_its_first_slashes_and_keeps_whole_line_comments():
+    assert eol('int x; // a // b') == 'int x;'
+    assert eol('    // note\nint x; // c') == '    // note\nint x;'
+
+def test_literals_do_not_run_across_lines():
+    assert [kind for kind, _ in lex_java('String s = "oops;\nint f() {\n}')] == ['code']
+    # The unterminated string no longer blanks the brace on the next line
+    assert find_bracket_errors(lex_java('String s = "oops;\nint f() {\n}')) == [2]
+
+def test_blanked_comments_keep_their_lines():
+    assert find_bracket_errors(lex_java('/* a\n b */\nint f() {\n}')) == [3]
+
+def test_header_ends_at_the_first_import_or_public_class():
+    student = '// Student\n// Period 1\nimport java.util.*;\n\n// helper\npublic class A\n{\n}'
+    assert preprocess_java_code(student) == 'import java.util.*;\n\n// helper\npublic class A\n{\n}'
+
+def test_bracket_lines_are_lines_of_the_original_file():
+    reference = '// Teacher\npublic class A\n{\n    void f()\n    {\n    }\n}\n'
+    student = '// Student\n// Period 1\n\npublic class A\n{\n    void f() {\n    }\n}\n'
+    _, mistake_tags = grade_java_code(reference, student)
+    assert 'Brackets:1' in mistake_tags and 'BracketLines:6' in mistake_tags
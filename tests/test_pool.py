@@ -0,0 +1,14 @@
+import multiprocessing
+import pytest
+import typealong_grader
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason="the crash is patched in before forking")
+def test_crashed_worker_only_fails_its_student(type_along, crash_on_student_7):
+    reference, students = type_along
+    expected = typealong_grader.grade_typealong(reference, students, 10)
+
+    crash_on_student_7()
+    grades = typealong_grader.grade_typealong(reference, students, 10, jobs=4)
+
+    assert grades[7] == ("Student7", 0, ["GradingError:BrokenProcessPool"])
+    assert grades[:7] + grades[8:] == expected[:7] + expected[8:]
@@ -0,0 +1,97 @@
+import os
+import http.client
+import multiprocessing
+import threading
+import pytest
+import typealong_grader
+from typealong_service import GradingClient, GradingService, make_server
+
+@pytest.fixture
+def serve():
+    """Start a service on a background thread, returning its address; everything is shut down afterwards."""
+    running = []
+
+    def start(service, unix_socket=None):
+        server = make_server(service, port=0, unix_socket=unix_socket, quiet=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        running.append((server, service))
+        return unix_socket or f"http://127.0.0.1:{server.server_port}"
+
+    yield start
+    for server, service in running:
+        server.shutdown()
+        server.server_close()
+        service.close()
+
+def test_grades_match_grade_typealong(type_along, serve, tmp_path):
+    reference, students = type_along
+    directory = os.path.dirname(students[0][1])
+    address = serve(GradingService(jobs=2, roots=[str(tmp_path)]))
+    grades = GradingClient(address).grade(reference, 10, directory)
+    assert grades == typealong_grader.grade_typealong(reference, typealong_grader.find_java_files(directory), 10)
+
+def test_uploaded_code_over_a_unix_socket(type_along, serve, tmp_path):
+    reference, students = type_along
+    address = serve(GradingService(jobs=2, roots=[str(tmp_path)]), str(tmp_path / "grader.sock"))
+    client = GradingClient(address)
+    uploads = [{'path': f"upload{number}.java", 'code': code} for number, (_, _, code) in enumerate(students)]
+    expected = typealong_grader.grade_typealong(reference, students, 10, bounded=True)
+    assert client.grade(reference, 10, students=uploads, bounded=True) == expected
+    assert client.status()['graded'] == len(students)
+
+def test_full_queue_asks_clients_to_retry(type_along, serve, tmp_path):
+    reference, students = type_along
+    address = serve(GradingService(jobs=1, queue_size=0, roots=[str(tmp_path)]))
+    with pytest.raises(RuntimeError, match="503"):
+        GradingClient(address, retries=0).grade(reference, 10, students=[{'path': students[0][1]}])
+
+def test_malformed_requests_get_an_error(type_along, serve, tmp_path):
+    reference, students = type_along
+    address = serve(GradingService(jobs=1, roots=[str(tmp_path)]))
+    client = GradingClient(address)
+    with pytest.raises(RuntimeError, match="400.*students must be a list"):
+        client.grade(reference, 10, students=5)
+    with pytest.raises(RuntimeError, match="400.*total_points"):
+        client._call('POST', '/grade', {'source_code': reference, 'students': []})
+    directory = os.path.dirname(students[0][1])
+    for option, value in [('max_file_size', "100"), ('bounded', "false"), ('include', "*.java"), ('exclude', [1])]:
+        with pytest.raises(RuntimeError, match=f"400.*{option}"):
+            client.grade(reference, 10, directory, **{option: value})
+
+    connection = http.client.HTTPConnection(*address[len("http://"):].split(':'))
+    connection.putrequest('POST', '/grade')
+    connection.putheader('Content-Length', 'many')
+    connection.endheaders()
+    assert connection.getresponse().status == 400
+    connection.close()
+
+@pytest.mark.skipif(multiprocessing.get_start_method() != 'fork', reason="the crash is patched in before forking")
+def test_service_recovers_from_a_crashed_worker(type_along, serve, tmp_path, crash_on_student_7):
+    reference, students = type_along
+    directory = os.path.dirname(students[0][1])
+    expected = typealong_grader.grade_typealong(reference, typealong_grader.find_java_files(directory), 10)
+    crashed = [name for name, _, _ in expected].index("Student7")
+    crash_on_student_7()
+    client = GradingClient(serve(GradingService(jobs=2, roots=[str(tmp_path)])))
+    for _ in range(2):
+        grades = client.grade(reference, 10, directory)
+        assert grades.pop(crashed) == ("Student7", 0, ["GradingError:BrokenProcessPool"])
+        assert grades == expected[:crashed] + expected[crashed + 1:]
+    assert client.status()['restarts'] >= 1
+
+def test_files_outside_the_roots_are_refused(type_along, serve, tmp_path, tmp_path_factory):
+    reference, students = type_along
+    outside = tmp_path_factory.mktemp("outside")
+    secret = outside / "Secret.java"
+    secret.write_text("// secret token\n")
+    os.symlink(secret, os.path.join(os.path.dirname(students[0][1]), "Linked.java"))
+    client = GradingClient(serve(GradingService(jobs=1, roots=[str(tmp_path)])))
+
+    with pytest.raises(RuntimeError, match="403"):
+        client.grade(reference, 10, students=[{'path': str(secret)}])
+    with pytest.raises(RuntimeError, match="403"):
+        client.grade(reference, 10, str(outside))
+    with pytest.raises(RuntimeError, match="403"):
+        client.grade(reference, 10, os.path.dirname(students[0][1]))
+    with pytest.raises(RuntimeError, match="403"):
+        client.grade(str(secret), 10, students=[{'path': students[0][1]}])
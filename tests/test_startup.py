@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+import pytest
+from typealong_bench import HEAVY_MODULES, check_startup, measure_startup
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_grader_starts_within_budget():
+    assert check_startup(measure_startup(repeat=3)) == []
+
+@pytest.mark.parametrize('module', ['typealong_grader', 'typealong_batch', 'typealong_results', 'typealong_service',
+                                    'typealong_similarity', 'typealong_watch'])
+def test_command_line_modules_import_lightly(module):
+    probe = (f"import sys, {module}\n"
+             f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))")
+    loaded = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True,
+                            cwd=ROOT).stdout.strip()
+    assert loaded == ''
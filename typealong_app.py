@@ -1,13 +1,252 @@
 import sys
 import os
-import pandas as pd
+import html
+import time
+from collections import OrderedDict
 from PyQt5.QtWidgets import (QApplication, QWidget, QLabel, QLineEdit, QPushButton, 
-                             QVBoxLayout, QHBoxLayout, QFileDialog, QTableWidget, 
-                             QTableWidgetItem, QMessageBox, QComboBox)
-from PyQt5.QtCore import Qt
+                             QVBoxLayout, QHBoxLayout, QFileDialog, QTableView, QAbstractItemView,
+                             QMessageBox, QComboBox, QSpinBox, QProgressBar, QCheckBox, QSplitter,
+                             QTextBrowser)
+from PyQt5.QtCore import (Qt, QThread, pyqtSignal, QAbstractTableModel, QModelIndex, QSortFilterProxyModel)
+from contextlib import nullcontext
 
 # Import the grading functions from the original script
-from typealong_grader import grade_typealong, find_java_files
+from typealong_grader import (PreparedReference, iter_mistakes, find_java_files, in_student_order, score_student,
+                              side_by_side, student_runs, StreamingResultWriter)
+import typealong_profile as profiling
+from typealong_results import ResultStore, code_digest
+from typealong_watch import SubmissionWatcher, write_results
+
+# Formats written row by row while grading runs; the rest are saved at the end
+STREAMING_FORMATS = {
+    'CSV (*.csv)': 'csv',
+    'Tab-Separated (*.tsv)': 'tsv',
+    'JSON Lines (*.jsonl)': 'jsonl'
+}
+
+# Every format results can be saved or exported in, as ResultStore.export names them
+EXPORT_FORMATS = {
+    'CSV (*.csv)': 'csv',
+    'Excel (*.xlsx)': 'excel',
+    'Tab-Separated (*.tsv)': 'tsv',
+    'JSON (*.json)': 'json',
+    'JSON Lines (*.jsonl)': 'jsonl',
+    'Parquet (*.parquet)': 'parquet'
+}
+
+# Seconds between checks for new or changed files while watching
+WATCH_INTERVAL = 0.5
+
+# Number of students whose side-by-side diffs are kept after they are shown
+DIFF_CACHE_SIZE = 64
+
+# Background colours of changed text in the diff view
+DIFF_COLORS = {'delete': '#ffc8c8', 'insert': '#c8f0c8'}
+
+class ResultsModel(QAbstractTableModel):
+    """A table of the students in a ResultStore, scored only when the view shows their row."""
+    HEADERS = ['Student Name', 'Score', 'Mistakes']
+
+    def __init__(self, store=None, parent=None):
+        super().__init__(parent)
+        self.store = store if store is not None else ResultStore()
+
+    def set_store(self, store):
+        self.beginResetModel()
+        self.store = store
+        self.endResetModel()
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.store)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal:
+            return self.HEADERS[section]
+        return None
+
+    def data(self, index, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole or not index.isValid():
+            return None
+        name, score, mistakes = self.store.grade(index.row())
+        # The score stays a number so the column sorts numerically
+        return (name, score, ', '.join(mistakes))[index.column()]
+
+    def put(self, name, path, num_mistakes, mistake_tags, digest=None):
+        """Add a student's result, or replace the one already shown for the same file"""
+        row = self.store.rows.get(path)
+        if row is None:
+            self.beginInsertRows(QModelIndex(), len(self.store), len(self.store))
+            self.store.put(name, path, num_mistakes, mistake_tags, digest)
+            self.endInsertRows()
+        else:
+            self.store.put(name, path, num_mistakes, mistake_tags, digest)
+            self.dataChanged.emit(self.index(row, 0), self.index(row, self.columnCount() - 1))
+
+    def remove(self, path):
+        """Drop the row of a student whose file was removed"""
+        row = self.store.rows.get(path)
+        if row is not None:
+            self.beginRemoveRows(QModelIndex(), row, row)
+            self.store.remove(path)
+            self.endRemoveRows()
+
+    def rescored(self):
+        """Redraw the scores after the store's points changed"""
+        if len(self.store):
+            self.dataChanged.emit(self.index(0, 1), self.index(len(self.store) - 1, 1))
+
+class DiffWorker(QThread):
+    """Diffs one student against the reference on a background thread for the side-by-side view.
+
+    The reference is prepared here the first time, from the store's
+    settings, and kept in self.reference so later diffs can reuse it. The
+    file is diffed as it is now, so the result says whether that is still
+    the code that was graded.
+    """
+    diff_ready = pyqtSignal(str, object, bool)  # student file, side_by_side line pairs, changed since grading
+    failed = pyqtSignal(str, str)               # student file, error message
+
+    def __init__(self, store, student_file, reference=None):
+        super().__init__()
+        self.store = store
+        self.student_file = student_file
+        self.reference = reference
+        self.row = store.rows[student_file]
+
+    def run(self):
+        settings = self.store.settings
+        try:
+            if self.reference is None:
+                self.reference = PreparedReference.load(settings['source_code'], settings['ignore_comments'])
+            with open(self.student_file, 'r') as student:
+                code = student.read()
+            runs = student_runs(self.reference, code, settings.get('engine', 'linear'))
+            self.diff_ready.emit(self.student_file, side_by_side(runs),
+                                 self.store.changed_since_grading(self.row, code))
+        except Exception as e:
+            self.failed.emit(self.student_file, str(e))
+
+def diff_html(pairs, changed=False):
+    """Render side_by_side line pairs as an HTML table, reference on the left and student on the right"""
+    def cell(segments):
+        parts = []
+        for op, text in segments:
+            text = html.escape('\u21b5' if text == '\n' else text).replace(' ', '&nbsp;')
+            parts.append(f'<span style="background-color:{DIFF_COLORS[op]}">{text}</span>'
+                         if op in DIFF_COLORS else text)
+        return ''.join(parts) or '&nbsp;'
+
+    rows = ''.join(f'<tr><td>{cell(left)}</td><td>{cell(right)}</td></tr>' for left, right in pairs)
+    note = ('<p><b>This file has changed since it was graded, so the differences shown may not match its '
+            'score. Grade it again to update the score.</b></p>' if changed else '')
+    return (f'{note}<table width="100%" cellspacing="0" cellpadding="1" style="font-family:monospace">'
+            f'<tr><th align="left">Reference</th><th align="left">Student</th></tr>{rows}</table>')
+
+class GradingWorker(QThread):
+    """Grades a class on a background thread, reporting each student as they finish."""
+    started_grading = pyqtSignal(int)        # number of students found
+    result_ready = pyqtSignal(object)        # (name, path, num_mistakes, mistake_tags, code digest), in student order
+    result_removed = pyqtSignal(str)         # path of a file removed while watching
+    finished_grading = pyqtSignal(list, bool)  # grades in student order, whether it was cancelled
+    failed = pyqtSignal(str)
+
+    def __init__(self, source_code, student_directory, total_points, points_per_mistake,
+                 ignore_comments, jobs, output_path=None, output_format=None, bounded=False,
+                 profile_path=None, watch=False):
+        super().__init__()
+        self.source_code = source_code
+        self.student_directory = student_directory
+        self.total_points = total_points
+        self.points_per_mistake = points_per_mistake
+        self.ignore_comments = ignore_comments
+        self.jobs = jobs
+        self.bounded = bounded
+        # Set for streaming formats: each row is appended to the file as soon as it is graded
+        self.output_path = output_path
+        self.output_format = output_format
+        # Set to record a GradingProfile of the run, saved to profile_path once results are saved
+        self.profile_path = profile_path
+        self.profile = profiling.GradingProfile() if profile_path else None
+        # Keep regrading files as they are added or changed until cancelled
+        self.watch = watch
+
+    def run(self):
+        with self.profile if self.profile is not None else nullcontext():
+            if self.watch:
+                self.watch_directory()
+            else:
+                self.grade()
+
+    def grade(self):
+        writer = None
+        try:
+            student_files = find_java_files(self.student_directory)
+            self.started_grading.emit(len(student_files))
+            if self.output_format is not None:
+                writer = StreamingResultWriter(self.output_path, ['Student Name', 'Score', 'Mistakes'],
+                                               self.output_format)
+
+            with profiling.stage('reference'):
+                reference = PreparedReference.load(self.source_code, self.ignore_comments)
+            work = [(reference, entry, self.total_points, self.points_per_mistake) for entry in student_files]
+            grades = [None] * len(student_files)
+            results = in_student_order(iter_mistakes(work, jobs=self.jobs, bounded=self.bounded))
+            for i, (num_mistakes, mistake_tags) in results:
+                name, path = student_files[i][:2]
+                grades[i] = grade = score_student(name, num_mistakes, mistake_tags, self.total_points,
+                                                  self.points_per_mistake)
+                self.result_ready.emit((name, path, num_mistakes, mistake_tags, code_digest(student_files[i][2])))
+                if writer is not None:
+                    name, score, mistakes = grade
+                    with profiling.stage('export'):
+                        writer.write((name, score, ', '.join(mistakes)))
+                if self.isInterruptionRequested():
+                    # Closing the generator cancels the students not yet started
+                    results.close()
+                    break
+
+            self.finished_grading.emit([grade for grade in grades if grade is not None], None in grades)
+        except Exception as e:
+            self.failed.emit(str(e))
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def watch_directory(self):
+        """Grade the directory, then regrade files as they land until cancelled."""
+        try:
+            watcher = SubmissionWatcher(self.source_code, self.student_directory, self.total_points,
+                                        self.points_per_mistake, self.ignore_comments, jobs=self.jobs,
+                                        bounded=self.bounded)
+            self.started_grading.emit(0)  # busy indicator for as long as the directory is watched
+            # Each file keeps its table row; files that appear later get new rows at the end
+            while not self.isInterruptionRequested():
+                started = time.monotonic()
+                changes = watcher.poll()
+                changed = False
+                for path, grade in changes:
+                    changed = True
+                    if grade is None:
+                        self.result_removed.emit(path)
+                    else:
+                        row = watcher.store.rows[path]
+                        self.result_ready.emit((watcher.store.names[row], path, *watcher.store.result(row),
+                                                watcher.store.digests[row]))
+                    if self.isInterruptionRequested():
+                        changes.close()
+                        break
+                if changed and self.output_format is not None:
+                    with profiling.stage('export'):
+                        write_results(self.output_path,
+                                      [(name, score, ', '.join(mistakes)) for name, score, mistakes in watcher.results()],
+                                      ['Student Name', 'Score', 'Mistakes'], self.output_format)
+                self.msleep(int(max(0.0, WATCH_INTERVAL - (time.monotonic() - started)) * 1000))
+            self.finished_grading.emit(watcher.results(), False)
+        except Exception as e:
+            self.failed.emit(str(e))
 
 class TypeAlongGraderApp(QWidget):
     def __init__(self):
@@ -63,6 +302,33 @@ class TypeAlongGraderApp(QWidget):
         self.comment_dropdown.setCurrentText('eol')  # Default to end-of-line
         comment_layout.addWidget(self.comment_label)
         comment_layout.addWidget(self.comment_dropdown)
+
+        # Parallel grading: 0 means one worker per CPU core
+        self.jobs_label = QLabel('Parallel Jobs:')
+        self.jobs_spinbox = QSpinBox()
+        self.jobs_spinbox.setRange(0, os.cpu_count() or 1)
+        self.jobs_spinbox.setSpecialValueText('All cores')
+        self.jobs_spinbox.setValue(1)
+        comment_layout.addWidget(self.jobs_label)
+        comment_layout.addWidget(self.jobs_spinbox)
+
+        # Bounded grading: stop diffing a student once they are certain to score 0
+        self.bounded_checkbox = QCheckBox('Stop at zero score')
+        self.bounded_checkbox.setToolTip('Skip the rest of the diff for wrong or empty files; '
+                                         'they score 0 and are tagged ExceedsThreshold')
+        comment_layout.addWidget(self.bounded_checkbox)
+
+        # Profiling: time every stage and student and save a JSON report next to the output
+        self.profile_checkbox = QCheckBox('Profile')
+        self.profile_checkbox.setToolTip('Save the time and peak memory of each grading stage and student '
+                                         'to a -profile.json file next to the output (grades on one core)')
+        comment_layout.addWidget(self.profile_checkbox)
+
+        # Watch mode: keep grading files as they are saved until Cancel is pressed
+        self.watch_checkbox = QCheckBox('Watch for changes')
+        self.watch_checkbox.setToolTip('Keep regrading new or changed files until Cancel is pressed; '
+                                       'CSV, TSV and JSON Lines output is kept up to date as they land')
+        comment_layout.addWidget(self.watch_checkbox)
         comment_layout.addStretch(1)  # Add stretch to prevent unnecessary expansion
         layout.addLayout(comment_layout)
 
@@ -81,6 +347,7 @@ class TypeAlongGraderApp(QWidget):
             'Excel (*.xlsx)', 
             'Tab-Separated (*.tsv)', 
             'JSON (*.json)', 
+            'JSON Lines (*.jsonl)',
             'Parquet (*.parquet)'
         ])
         self.output_format_dropdown.currentTextChanged.connect(self.update_output_extension)
@@ -92,18 +359,71 @@ class TypeAlongGraderApp(QWidget):
         output_layout.addWidget(self.output_browse)
         layout.addLayout(output_layout)
 
-        # Grade Button
+        # Grade and Cancel Buttons
+        grade_layout = QHBoxLayout()
         self.grade_button = QPushButton('Grade Assignments')
         self.grade_button.clicked.connect(self.grade_assignments)
-        layout.addWidget(self.grade_button)
+        self.cancel_button = QPushButton('Cancel')
+        self.cancel_button.clicked.connect(self.cancel_grading)
+        self.cancel_button.setEnabled(False)
+        grade_layout.addWidget(self.grade_button)
+        grade_layout.addWidget(self.cancel_button)
+
+        # Work with graded results without diffing again: reopen a saved session,
+        # rescore it with the points above, or export it to the chosen output file and format
+        self.open_session_button = QPushButton('Open Session')
+        self.open_session_button.clicked.connect(self.open_session)
+        self.rescore_button = QPushButton('Rescore')
+        self.rescore_button.setToolTip('Recompute scores with the points above without grading again')
+        self.rescore_button.clicked.connect(self.rescore)
+        self.export_button = QPushButton('Export')
+        self.export_button.setToolTip('Save the results to the output file in the chosen format')
+        self.export_button.clicked.connect(self.export_results)
+        self.rescore_button.setEnabled(False)
+        self.export_button.setEnabled(False)
+        grade_layout.addWidget(self.open_session_button)
+        grade_layout.addWidget(self.rescore_button)
+        grade_layout.addWidget(self.export_button)
+        layout.addLayout(grade_layout)
+
+        # Grading Progress
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setValue(0)
+        layout.addWidget(self.progress_bar)
 
         # Results Table
-        self.results_table = QTableWidget()
-        self.results_table.setColumnCount(3)
-        self.results_table.setHorizontalHeaderLabels(['Student Name', 'Score', 'Mistakes'])
-        layout.addWidget(self.results_table)
+        # Results Table: a view over the result store, sortable by clicking a column header
+        self.results_model = ResultsModel(parent=self)
+        self.sorted_results = QSortFilterProxyModel(self)
+        self.sorted_results.setSourceModel(self.results_model)
+        self.results_table = QTableView()
+        self.results_table.setModel(self.sorted_results)
+        self.results_table.setSortingEnabled(True)
+        # Enabling sorting sorts by the first column straight away; keep grading order until a header is clicked
+        self.results_table.sortByColumn(-1, Qt.AscendingOrder)
+        self.results_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.results_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.results_table.horizontalHeader().setStretchLastSection(True)
+        self.results_table.selectionModel().currentRowChanged.connect(self.show_diff)
+
+        # Side-by-side diff of the selected student, worked out in the background when they are selected
+        self.diff_view = QTextBrowser()
+        self.diff_view.setPlaceholderText('Select a student to see how their code differs from the reference')
+        results_splitter = QSplitter(Qt.Vertical)
+        results_splitter.addWidget(self.results_table)
+        results_splitter.addWidget(self.diff_view)
+        layout.addWidget(results_splitter)
 
         self.setLayout(layout)
+        self.worker = None
+        self.store = None
+        # Side-by-side diffs already worked out, as (line pairs, whether the file changed since it was
+        # graded) by student file. One diff runs at a time, and a
+        # student selected meanwhile waits in pending_diff; the reference is prepared once per store
+        self.diffs = OrderedDict()
+        self.diff_worker = None
+        self.pending_diff = None
+        self.diff_reference = None
 
     def update_output_extension(self, format_text):
         """Update the output file extension based on selected format"""
@@ -117,6 +437,7 @@ class TypeAlongGraderApp(QWidget):
             'Excel (*.xlsx)': '.xlsx',
             'Tab-Separated (*.tsv)': '.tsv',
             'JSON (*.json)': '.json',
+            'JSON Lines (*.jsonl)': '.jsonl',
             'Parquet (*.parquet)': '.parquet'
         }
         
@@ -145,6 +466,7 @@ class TypeAlongGraderApp(QWidget):
             'Excel (*.xlsx)': 'Excel Files (*.xlsx)',
             'Tab-Separated (*.tsv)': 'Tab-Separated Files (*.tsv)',
             'JSON (*.json)': 'JSON Files (*.json)',
+            'JSON Lines (*.jsonl)': 'JSON Lines Files (*.jsonl)',
             'Parquet (*.parquet)': 'Parquet Files (*.parquet)'
         }
         
@@ -163,51 +485,204 @@ class TypeAlongGraderApp(QWidget):
         if not self.validate_inputs():
             return
 
+        # Start a new store for this run's results, keeping the settings to rescore and diff with later
+        self.store = ResultStore({'source_code': os.path.abspath(self.source_path.text()),
+                                  'student_directory': os.path.abspath(self.dir_path.text()),
+                                  'total_points': float(self.total_points.text()),
+                                  'points_per_mistake': float(self.points_per_mistake.text()),
+                                  'ignore_comments': self.comment_dropdown.currentText(), 'engine': 'linear',
+                                  'bounded': self.bounded_checkbox.isChecked(), 'max_edits': None})
+        self.show_store()
+        self.progress_bar.setMaximum(0)  # busy indicator until the files are found
+        self.progress_bar.setValue(0)
+        self.grade_button.setEnabled(False)
+        self.cancel_button.setEnabled(True)
+        self.open_session_button.setEnabled(False)
+        self.rescore_button.setEnabled(False)
+        self.export_button.setEnabled(False)
+
+        # Grade on a background thread so the window stays responsive
+        self.worker = GradingWorker(
+            self.source_path.text(),
+            self.dir_path.text(),
+            float(self.total_points.text()),
+            float(self.points_per_mistake.text()),
+            self.comment_dropdown.currentText(),
+            self.jobs_spinbox.value(),
+            self.output_path.text(),
+            STREAMING_FORMATS.get(self.output_format_dropdown.currentText()),
+            self.bounded_checkbox.isChecked(),
+            os.path.splitext(self.output_path.text())[0] + '-profile.json'
+            if self.profile_checkbox.isChecked() else None,
+            self.watch_checkbox.isChecked()
+        )
+        self.worker.started_grading.connect(self.progress_bar.setMaximum)
+        self.worker.result_ready.connect(self.add_result)
+        self.worker.result_removed.connect(self.remove_result)
+        self.worker.finished_grading.connect(self.save_results)
+        self.worker.finished_grading.connect(self.save_profile)
+        self.worker.failed.connect(self.grading_failed)
+        self.worker.finished.connect(self.grading_stopped)
+        self.worker.start()
+
+    def cancel_grading(self):
+        if self.worker is not None:
+            self.worker.requestInterruption()
+            self.cancel_button.setEnabled(False)
+
+    def add_result(self, result):
+        """Show a finished student's result as soon as it arrives"""
+        self.results_model.put(*result)
+        self.diffs.pop(result[1], None)  # a regraded file's diff may have changed
+        self.progress_bar.setValue(self.progress_bar.value() + 1)
+
+    def remove_result(self, path):
+        """Drop a student whose file was removed while watching, so it is not saved or exported"""
+        self.results_model.remove(path)
+        self.diffs.pop(path, None)
+
+    def show_store(self):
+        """Show the current results in the table, dropping diffs worked out for earlier ones"""
+        self.diffs.clear()
+        self.pending_diff = None
+        self.diff_reference = None
+        self.diff_view.clear()
+        self.results_model.set_store(self.store)
+
+    def show_diff(self, current, previous=None):
+        """Show the selected student's side-by-side diff, working it out in the background the first time"""
+        student_file = self.file_at(current)
+        if student_file is None:
+            self.diff_view.clear()
+            return
+        if student_file in self.diffs:
+            self.diffs.move_to_end(student_file)
+            self.diff_view.setHtml(diff_html(*self.diffs[student_file]))
+            return
+        if 'ExceedsThreshold' in self.store.flags[self.store.rows[student_file]]:
+            # Grading gave up on these files as too different to score, and a full diff would be as slow
+            self.diff_view.setPlainText(f'{student_file} was not compared in full because it is too different '
+                                        f'from the reference (tagged ExceedsThreshold).')
+            return
+        self.diff_view.setPlainText('Comparing with the reference...')
+        if self.diff_worker is not None:
+            # Only the latest selection is worked out once the running diff finishes
+            self.pending_diff = student_file
+            return
+        self.diff_worker = DiffWorker(self.store, student_file, self.diff_reference)
+        self.diff_worker.diff_ready.connect(self.diff_ready)
+        self.diff_worker.failed.connect(self.diff_failed)
+        self.diff_worker.start()
+
+    def file_at(self, index):
+        """The student file shown in a row of the (sorted) table, if any"""
+        if not index.isValid():
+            return None
+        return self.store.paths[self.sorted_results.mapToSource(index).row()]
+
+    def diff_finished(self):
+        """Collect the finished diff worker, returning whether its diff is for the results shown now"""
+        worker, self.diff_worker = self.diff_worker, None
+        worker.wait()
+        if worker.store is not self.store:
+            return False
+        self.diff_reference = worker.reference
+        return True
+
+    def show_pending_diff(self):
+        """Start the diff of a student selected while the last one was running, if they are still selected"""
+        pending, self.pending_diff = self.pending_diff, None
+        current = self.results_table.currentIndex()
+        if pending is not None and pending == self.file_at(current):
+            self.show_diff(current)
+
+    def diff_ready(self, student_file, pairs, changed):
+        if self.diff_finished():
+            self.diffs[student_file] = (pairs, changed)
+            while len(self.diffs) > DIFF_CACHE_SIZE:
+                self.diffs.popitem(last=False)
+            # Only show it if the student is still selected
+            if student_file == self.file_at(self.results_table.currentIndex()):
+                self.diff_view.setHtml(diff_html(pairs, changed))
+        self.show_pending_diff()
+
+    def diff_failed(self, student_file, message):
+        if self.diff_finished() and student_file == self.file_at(self.results_table.currentIndex()):
+            self.diff_view.setPlainText(f'Could not compare {student_file} with the reference: {message}')
+        self.show_pending_diff()
+
+    def session_path(self):
+        return os.path.splitext(self.output_path.text())[0] + '-session.typealong'
+
+    def open_session(self):
+        filename, _ = QFileDialog.getOpenFileName(self, 'Open Grading Session', self.session_path(),
+                                                  'Grading Sessions (*.typealong)')
+        if not filename:
+            return
         try:
-            # Find student files
-            student_files = find_java_files(self.dir_path.text())
+            self.store = ResultStore.load(filename)
+        except (OSError, ValueError, KeyError) as e:
+            QMessageBox.critical(self, 'Error', f'Could not open {filename}: {e}')
+            return
+        settings = self.store.settings
+        self.source_path.setText(settings.get('source_code') or '')
+        self.dir_path.setText(settings.get('student_directory') or '')
+        self.total_points.setText(str(settings['total_points']))
+        self.points_per_mistake.setText(str(settings['points_per_mistake']))
+        self.comment_dropdown.setCurrentText(settings['ignore_comments'])
+        self.show_store()
+        self.rescore_button.setEnabled(True)
+        self.export_button.setEnabled(True)
 
-            # Grade assignments
+    def rescore(self):
+        try:
             total_points = float(self.total_points.text())
             points_per_mistake = float(self.points_per_mistake.text())
-            ignore_comments = self.comment_dropdown.currentText()
-            
-            grades = grade_typealong(
-                self.source_path.text(), 
-                student_files, 
-                total_points, 
-                points_per_mistake,
-                ignore_comments
-            )
-
-            # Convert grades to pandas DataFrame
-            df = pd.DataFrame(grades, columns=['Student Name', 'Score', 'Mistakes'])
-            
-            # Explode the Mistakes column to make it more readable
-            df['Mistakes'] = df['Mistakes'].apply(lambda x: ', '.join(x))
-
-            # Save based on selected format
-            output_path = self.output_path.text()
-            output_format = self.output_format_dropdown.currentText().split()[0].lower()
-
-            # Save using appropriate pandas method
-            if output_format == 'csv':
-                df.to_csv(output_path, index=False)
-            elif output_format == 'excel':
-                df.to_excel(output_path, index=False)
-            elif output_format == 'tab-separated':
-                df.to_csv(output_path, sep='\t', index=False)
-            elif output_format == 'json':
-                df.to_json(output_path, orient='records')
-            elif output_format == 'parquet':
-                df.to_parquet(output_path, index=False)
-
-            # Populate results table
-            self.results_table.setRowCount(len(grades))
-            for row, (name, score, mistakes) in enumerate(grades):
-                self.results_table.setItem(row, 0, QTableWidgetItem(name))
-                self.results_table.setItem(row, 1, QTableWidgetItem(str(score)))
-                self.results_table.setItem(row, 2, QTableWidgetItem(', '.join(mistakes)))
+        except ValueError:
+            QMessageBox.warning(self, 'Invalid Input', 'Points must be numeric.')
+            return
+        self.store.settings.update(total_points=total_points, points_per_mistake=points_per_mistake)
+        self.results_model.rescored()
+        stale = self.store.needs_regrading()
+        if stale:
+            QMessageBox.warning(self, 'Rescored',
+                                f'{len(stale)} students were graded with "Stop at zero score" and could score '
+                                f'above 0 with these points. They still score 0 until they are graded '
+                                f'again without it.')
+
+    def export_results(self):
+        output_path = self.output_path.text()
+        try:
+            self.store.export(output_path, EXPORT_FORMATS[self.output_format_dropdown.currentText()])
+            self.store.save(self.session_path())
+        except Exception as e:
+            QMessageBox.critical(self, 'Error', str(e))
+            return
+        QMessageBox.information(self, 'Export Complete', f'Exported {len(self.store)} students to {output_path}')
+
+    def save_results(self, grades, cancelled):
+        output_path = self.worker.output_path
+        streamed = self.worker.output_format is not None
+        try:
+            # Keep every run as a session, so it can be rescored or exported after the app closes
+            self.store.save(self.session_path())
+        except OSError as e:
+            QMessageBox.critical(self, 'Error', f'Could not save the session: {e}')
+        if cancelled:
+            saved = f'Partial results saved to {output_path}' if streamed else 'No results were saved.'
+            QMessageBox.information(self, 'Grading Cancelled',
+                                    f'Cancelled after grading {len(grades)} of '
+                                    f'{self.progress_bar.maximum()} assignments. {saved}')
+            return
+        if streamed:
+            QMessageBox.information(self, 'Grading Complete', 
+                                    f'Graded {len(grades)} assignments. '
+                                    f'Results saved to {output_path}')
+            return
+
+        try:
+            with self.worker.profile.stage('export') if self.worker.profile is not None else nullcontext():
+                self.store.export(output_path, EXPORT_FORMATS[self.output_format_dropdown.currentText()])
 
             # Show success message
             QMessageBox.information(self, 'Grading Complete', 
@@ -217,6 +692,35 @@ class TypeAlongGraderApp(QWidget):
         except Exception as e:
             QMessageBox.critical(self, 'Error', str(e))
 
+    def save_profile(self, grades, cancelled):
+        if self.worker.profile is None:
+            return
+        try:
+            self.worker.profile.write(self.worker.profile_path)
+        except OSError as e:
+            QMessageBox.critical(self, 'Error', str(e))
+
+    def grading_failed(self, message):
+        QMessageBox.critical(self, 'Error', message)
+
+    def grading_stopped(self):
+        self.grade_button.setEnabled(True)
+        self.cancel_button.setEnabled(False)
+        self.open_session_button.setEnabled(True)
+        self.rescore_button.setEnabled(self.store is not None)
+        self.export_button.setEnabled(self.store is not None)
+        if self.progress_bar.maximum() == 0:
+            self.progress_bar.setMaximum(1)  # leave the busy indicator if grading failed early
+
+    def closeEvent(self, event):
+        # Stop a running grade before the window goes away
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.requestInterruption()
+            self.worker.wait()
+        if self.diff_worker is not None:
+            self.diff_worker.wait()
+        event.accept()
+
     def validate_inputs(self):
         # Check if all required fields are filled
         if not self.source_path.text():
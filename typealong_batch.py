@@ -0,0 +1,128 @@
+import os
+import csv
+import json
+import argparse
+from typing import Iterator, List, NamedTuple, Tuple
+from typealong_cache import GradingCache
+import typealong_profile as profiling
+from typealong_grader import (PreparedReference, StreamingResultWriter, add_grading_options, find_java_files,
+                              in_student_order, iter_grades)
+from typealong_similarity import similarity_groups
+
+class Assignment(NamedTuple):
+    """One type-along to grade: a reference solution, a directory of students and its grading settings."""
+    name: str
+    source_code: str
+    student_directory: str
+    total_points: float
+    ignore_comments: str = 'eol'
+    points_per_mistake: float = 0.1
+
+def load_manifest(path: str) -> List[Assignment]:
+    """Read the assignments to grade from a CSV or JSON manifest.
+
+    CSV manifests have a header row and JSON manifests are a list of objects,
+    both with the fields source_code, student_directory and total_points, and
+    optionally name (default: the student directory's path relative to the
+    manifest), ignore_comments (default: eol) and points_per_mistake
+    (default: 0.1). Relative paths are relative to the manifest, and every
+    assignment needs a name of its own.
+    """
+    with open(path, 'r', newline='') as manifest:
+        if os.path.splitext(path)[1].lower() == '.json':
+            entries = json.load(manifest)
+        else:
+            entries = list(csv.DictReader(manifest))
+
+    base = os.path.dirname(os.path.abspath(path))
+    assignments = []
+    for number, entry in enumerate(entries, 1):
+        try:
+            source_code = os.path.join(base, entry['source_code'])
+            student_directory = os.path.join(base, entry['student_directory'])
+            total_points = float(entry['total_points'])
+            # CSV manifests leave an empty string for a missing value
+            points_per_mistake = entry.get('points_per_mistake')
+            points_per_mistake = 0.1 if points_per_mistake in (None, '') else float(points_per_mistake)
+        except KeyError as e:
+            raise ValueError(f"Manifest entry {number} is missing {e}") from None
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Manifest entry {number} is invalid: {e}") from None
+        name = entry.get('name') or os.path.relpath(student_directory, base)
+        if any(assignment.name == name for assignment in assignments):
+            raise ValueError(f"Manifest entry {number} has the same name as an earlier one: {name}")
+        assignments.append(Assignment(
+            name,
+            source_code,
+            student_directory,
+            total_points,
+            entry.get('ignore_comments') or 'eol',
+            points_per_mistake))
+    return assignments
+
+def iter_batch(assignments: List[Assignment], engine: str = 'linear', jobs: int = 1, cache: GradingCache = None,
+               bounded: bool = False, max_edits: int = None, io_jobs: int = 8, similarity: bool = False,
+               include: List[str] = ('*.java',), exclude: List[str] = (), max_file_size: int = None,
+               similarity_min_shared: int = 3) -> Iterator[Tuple[int, tuple]]:
+    """Grade several assignments together, yielding (index, (assignment, name, score, mistakes)).
+
+    Every student of every assignment goes through one process pool, and a
+    reference shared by several assignments is only prepared once. Indexes
+    number the students of all assignments in manifest order. With
+    similarity, each row also ends with the student's similarity group
+    within their assignment (see typealong_similarity), or None. include,
+    exclude and max_file_size pick the files in every student directory, as
+    for find_java_files.
+    """
+    references = {}
+    work = []
+    names = []
+    groups = []
+    for assignment in assignments:
+        key = (os.path.abspath(assignment.source_code), assignment.ignore_comments)
+        if key not in references:
+            with profiling.stage('reference'):
+                references[key] = PreparedReference.load(assignment.source_code, assignment.ignore_comments)
+        entries = find_java_files(assignment.student_directory, include, exclude, max_file_size, io_jobs)
+        if similarity:
+            with open(assignment.source_code, 'r') as src, profiling.stage('similarity'):
+                groups.extend(similarity_groups(src.read(), entries, min_shared=similarity_min_shared))
+        for entry in entries:
+            work.append((references[key], entry, assignment.total_points, assignment.points_per_mistake))
+            names.append(assignment.name)
+
+    for i, grade in iter_grades(work, engine, jobs, cache, bounded, max_edits):
+        row = (names[i],) + tuple(grade)
+        yield i, row + (groups[i],) if similarity else row
+
+def main():
+    """Grade every assignment in a manifest in one run, writing one combined results file."""
+    parser = argparse.ArgumentParser(description="Grade several type-along assignments listed in a manifest")
+    parser.add_argument("manifest", help="CSV or JSON file listing source_code, student_directory, total_points "
+                                         "and optionally name, ignore_comments and points_per_mistake")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes shared by all assignments, 0 for all cores (default: 1)")
+    add_grading_options(parser)
+    parser.add_argument("--output", default="typealong-batch.csv",
+                        help="Path to the combined output file (default: typealong-batch.csv)")
+
+    args = parser.parse_args()
+
+    assignments = load_manifest(args.manifest)
+    cache = GradingCache(args.cache, args.cache_size) if args.cache else None
+    try:
+        columns = ["Assignment", "StudentName", "Score", "Mistakes"] + (["SimilarGroup"] if args.similarity else [])
+        with StreamingResultWriter(args.output, columns, args.format) as writer:
+            for _, row in in_student_order(iter_batch(assignments, args.diff_engine, args.jobs, cache, args.bounded,
+                                                      args.max_edits, args.io_jobs, args.similarity,
+                                                      args.include or ['*.java'], args.exclude, args.max_file_size,
+                                                      args.similarity_min_shared)):
+                writer.write(row)
+    finally:
+        if cache is not None:
+            cache.close()
+
+    print(f"Graded {len(assignments)} assignments. Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
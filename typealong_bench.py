@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import subprocess
+from typing import Dict, List
+from typealong_cache import GradingCache
+import typealong_profile as profiling
+from typealong_grader import DIFF_ENGINES, StreamingResultWriter, find_java_files, grade_typealong
+
+ERROR_TYPES = ('typo', 'missing_line', 'indent_drift', 'knr_brace')
+# Stages typealong_profile records while grading serially, then the timings of whole grading runs
+PROFILE_STAGES = ('find_files', 'read_files', 'reference', 'preprocess', 'brackets', 'diff', 'classify', 'export')
+STAGES = PROFILE_STAGES + ('grade', 'grade_cached')
+# Modules the command-line grader must not import unless an option needs them
+HEAVY_MODULES = ('pandas', 'openpyxl', 'PyQt5', 'multiprocessing', 'sqlite3')
+# Default limit on the best of several command-line startups, in seconds
+STARTUP_BUDGET = 0.25
+
+def _typo(line: str, rng: random.Random) -> str:
+    pos = rng.randrange(len(line) + 1)
+    kind = rng.choice(('replace', 'insert', 'delete')) if line else 'insert'
+    if kind == 'insert':
+        return line[:pos] + rng.choice('abcdefghijklmnopqrstuvwxyz;(). ') + line[pos:]
+    pos = min(pos, len(line) - 1)
+    replacement = '' if kind == 'delete' else rng.choice('abcdefghijklmnopqrstuvwxyz')
+    return line[:pos] + replacement + line[pos + 1:]
+
+def _indent_drift(line: str, rng: random.Random) -> str:
+    body = line.lstrip()
+    indent = line[:len(line) - len(body)]
+    return rng.choice((indent + ' ', indent[:-1], indent.replace('    ', '\t'))) + body
+
+def generate_submission(reference: str, error_rate: float, rng: random.Random, header: str = '') -> str:
+    """Copy the reference with each line getting a random mistake with probability error_rate."""
+    lines = reference.split('\n')
+    out = []
+    for i in range(len(lines)):
+        if rng.random() >= error_rate:
+            out.append(lines[i])
+            continue
+        error = rng.choice(ERROR_TYPES)
+        if error == 'missing_line':
+            continue
+        if error == 'knr_brace' and lines[i].strip() == '{' and out:
+            out[-1] += ' {'
+            continue
+        out.append(_indent_drift(lines[i], rng) if error == 'indent_drift' else _typo(lines[i], rng))
+    return header + '\n'.join(out)
+
+def generate_class(reference: str, directory: str, size: int, error_rate: float, seed: int = 0) -> List[str]:
+    """Write size synthetic student files into directory and return their paths."""
+    rng = random.Random(seed)
+    paths = []
+    for i in range(size):
+        path = os.path.join(directory, f"student{i:04d}.java")
+        with open(path, 'w') as student:
+            student.write(generate_submission(reference, error_rate, rng, f"// Student{i}\n// Period 1\n"))
+        paths.append(path)
+    return paths
+
+def time_pipeline(reference_path: str, student_directory: str, output_path: str, ignore_comments: str = 'eol',
+                  engine: str = 'linear', total_points: float = 10, points_per_mistake: float = 0.1, jobs: int = 1,
+                  bounded: bool = False, max_edits: int = None, cache_path: str = None) -> Dict[str, float]:
+    """Grade a class as the grader does, returning the seconds spent in each of STAGES.
+
+    The PROFILE_STAGES come from a GradingProfile of a serial run, which is
+    how profiles are recorded. grade is then a whole grade_typealong run
+    with jobs, bounded and max_edits, and with a cache_path, grade_cached is
+    the same run again once the cache is filled.
+    """
+    profile = profiling.GradingProfile(track_memory=False)
+    with profile:
+        student_files = find_java_files(student_directory)
+        grades = grade_typealong(reference_path, student_files, total_points, points_per_mistake, ignore_comments,
+                                 engine, bounded=bounded, max_edits=max_edits)
+        with profiling.stage('export'), StreamingResultWriter(output_path) as writer:
+            for grade in grades:
+                writer.write(grade)
+    times = dict.fromkeys(STAGES, 0.0)
+    times.update((name, totals['seconds']) for name, totals in profile.stages.items() if name in times)
+
+    cache = GradingCache(cache_path) if cache_path else None
+    try:
+        for stage in ('grade', 'grade_cached') if cache is not None else ('grade',):
+            start = time.perf_counter()
+            grade_typealong(reference_path, find_java_files(student_directory), total_points, points_per_mistake,
+                            ignore_comments, engine, jobs, cache, bounded, max_edits)
+            times[stage] = time.perf_counter() - start
+    finally:
+        if cache is not None:
+            cache.close()
+    return times
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def run_benchmark(reference_path: str, size: int = 100, error_rate: float = 0.05, seed: int = 0,
+                  repeat: int = 3, ignore_comments: str = 'eol', engine: str = 'linear', jobs: int = 1,
+                  bounded: bool = False, max_edits: int = None, cache: bool = False) -> dict:
+    """Generate a synthetic class and time the pipeline on it, keeping the best time of each stage."""
+    with open(reference_path, 'r') as src:
+        reference = src.read()
+    with tempfile.TemporaryDirectory() as directory:
+        class_directory = os.path.join(directory, 'class')
+        os.mkdir(class_directory)
+        generate_class(reference, class_directory, size, error_rate, seed)
+        # Every run starts from an empty cache, so grade is never served from it
+        runs = [time_pipeline(reference_path, class_directory, os.path.join(directory, 'graded.csv'),
+                              ignore_comments, engine, jobs=jobs, bounded=bounded, max_edits=max_edits,
+                              cache_path=os.path.join(directory, f'cache{n}.sqlite') if cache else None)
+                for n in range(repeat)]
+    stages = {stage: min(run[stage] for run in runs) for stage in STAGES}
+    return {
+        'commit': _git_commit(),
+        'python': platform.python_version(),
+        'settings': {'reference': os.path.basename(reference_path), 'size': size, 'error_rate': error_rate,
+                     'seed': seed, 'repeat': repeat, 'ignore_comments': ignore_comments, 'engine': engine,
+                     'jobs': jobs, 'bounded': bounded, 'max_edits': max_edits, 'cache': cache},
+        'stages': stages,
+        'total': stages['grade'],
+    }
+
+def measure_startup(repeat: int = 5) -> dict:
+    """Time starting the command-line grader in a fresh interpreter, keeping the best of repeat runs.
+
+    Returns the seconds for the whole process to start and print its help,
+    the seconds spent importing typealong_grader, and the HEAVY_MODULES that
+    importing it loaded.
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    probe = ("import sys, time\n"
+             "start = time.perf_counter()\n"
+             "import typealong_grader\n"
+             "print(time.perf_counter() - start)\n"
+             f"print(','.join(name for name in {HEAVY_MODULES!r} if name in sys.modules))\n")
+    process_times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(here, 'typealong_grader.py'), '--help'],
+                       stdout=subprocess.DEVNULL, check=True, cwd=here)
+        process_times.append(time.perf_counter() - start)
+    import_times = []
+    for _ in range(repeat):
+        output = subprocess.run([sys.executable, '-c', probe], capture_output=True, text=True, check=True,
+                                cwd=here).stdout.split('\n')
+        import_times.append(float(output[0]))
+    return {
+        'process': min(process_times),
+        'import': min(import_times),
+        'heavy_modules': [name for name in output[1].split(',') if name],
+    }
+
+def check_startup(startup: dict, budget: float = STARTUP_BUDGET) -> List[str]:
+    """The ways a measure_startup result breaks the startup budget, if any."""
+    problems = []
+    if startup['process'] > budget:
+        problems.append(f"starting the grader took {startup['process'] * 1000:.0f} ms, "
+                        f"over the {budget * 1000:.0f} ms budget")
+    if startup['heavy_modules']:
+        problems.append(f"importing typealong_grader loaded {', '.join(startup['heavy_modules'])}")
+    return problems
+
+def compare(baseline: dict, result: dict) -> str:
+    """Format a stage by stage comparison of two benchmark results."""
+    rows = [f"{'stage':<12}{'baseline':>12}{'current':>12}{'ratio':>8}"]
+    for stage in list(STAGES) + ['total']:
+        old = baseline['total'] if stage == 'total' else baseline['stages'].get(stage, 0)
+        new = result['total'] if stage == 'total' else result['stages'].get(stage, 0)
+        ratio = f"{new / old:.2f}x" if old else '-'
+        rows.append(f"{stage:<12}{old:>12.4f}{new:>12.4f}{ratio:>8}")
+    return '\n'.join(rows)
+
+def main():
+    """Benchmark the grading pipeline on a synthetic class generated from a reference file."""
+    parser = argparse.ArgumentParser(description="Benchmark the type-along grading pipeline")
+    parser.add_argument("source_code", nargs="?",
+                        help="Path to the reference Java file to generate submissions from")
+    parser.add_argument("--size", type=int, default=100, help="Number of synthetic students (default: 100)")
+    parser.add_argument("--error_rate", type=float, default=0.05,
+                        help="Chance of a mistake on each line (default: 0.05)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic class (default: 0)")
+    parser.add_argument("--repeat", type=int, default=3,
+                        help="Times to run the pipeline; the best time of each stage is kept (default: 3)")
+    parser.add_argument("--ignore_comments", type=str, default="eol")
+    parser.add_argument("--diff_engine", choices=sorted(DIFF_ENGINES), default="linear")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes for the timed grade runs, 0 for all cores (default: 1)")
+    parser.add_argument("--bounded", action="store_true", help="Time bounded grading (see the grader's --bounded)")
+    parser.add_argument("--max_edits", type=int, default=None, help="Time grading with this --max_edits")
+    parser.add_argument("--cache", action="store_true",
+                        help="Grade with a results cache and also time a rerun once it is filled")
+    parser.add_argument("--output", default=None, help="Path to write the JSON results to (default: stdout)")
+    parser.add_argument("--compare", default=None, help="JSON results of an earlier run to compare against")
+    parser.add_argument("--startup", action="store_true",
+                        help="Only check the command-line grader's startup time, failing if it is over budget")
+    parser.add_argument("--startup_budget", type=float, default=STARTUP_BUDGET,
+                        help=f"Startup time allowed by --startup, in seconds (default: {STARTUP_BUDGET})")
+
+    args = parser.parse_args()
+
+    if args.startup:
+        startup = measure_startup(args.repeat)
+        print(f"startup {startup['process'] * 1000:.1f} ms (import {startup['import'] * 1000:.1f} ms)")
+        problems = check_startup(startup, args.startup_budget)
+        for problem in problems:
+            print(f"FAIL: {problem}", file=sys.stderr)
+        sys.exit(1 if problems else 0)
+    if args.source_code is None:
+        parser.error("source_code is required unless --startup is given")
+
+    result = run_benchmark(args.source_code, args.size, args.error_rate, args.seed, args.repeat,
+                           args.ignore_comments, args.diff_engine, args.jobs, args.bounded, args.max_edits,
+                           args.cache)
+    if args.output:
+        with open(args.output, 'w') as out:
+            json.dump(result, out, indent=2)
+    else:
+        json.dump(result, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare, 'r') as baseline:
+            print(compare(json.load(baseline), result), file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+import json
+import time
+import hashlib
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Bump whenever a change to the grader would give different mistakes for the
+# same files, so results cached by older versions are never reused
+CACHE_VERSION = 4
+
+def result_key(reference_digest: str, student_file: str, engine: str, student_code: str = None) -> Optional[str]:
+    """Key a student's grading result by the file contents and the grading settings.
+
+    The file is only read if its code is not passed in. Returns None if the
+    file cannot be read as text (such files are never cached).
+    """
+    if student_code is None:
+        try:
+            with open(student_file, 'r') as student:
+                student_code = student.read()
+        except (OSError, ValueError):
+            return None
+    student_digest = hashlib.sha256(student_code.encode('utf-8', 'surrogatepass')).hexdigest()
+    return hashlib.sha256(f"{CACHE_VERSION}:{engine}:{reference_digest}:{student_digest}".encode()).hexdigest()
+
+class GradingCache:
+    """On-disk SQLite cache of (num_mistakes, mistake_tags) per graded submission.
+
+    Only the raw mistakes are stored, so changing total points or points per
+    mistake reuses the cache. Once more than max_entries results are stored,
+    the least recently used ones are evicted.
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        self.path = path
+        self.max_entries = max_entries
+        import sqlite3  # Only needed when caching, so the CLI starts faster without it
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS results ("
+            "key TEXT PRIMARY KEY, mistakes INTEGER NOT NULL, tags TEXT NOT NULL, last_used REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS results_last_used ON results (last_used)")
+        self.connection.commit()
+
+    def get_many(self, keys: Iterable[Optional[str]]) -> Dict[str, Tuple[int, List[str]]]:
+        """Look up several keys at once, returning only the ones that are cached."""
+        keys = [key for key in keys if key is not None]
+        found = {}
+        # Stay under SQLite's limit on query parameters
+        for start in range(0, len(keys), 500):
+            batch = keys[start:start + 500]
+            rows = self.connection.execute(
+                f"SELECT key, mistakes, tags FROM results WHERE key IN ({','.join('?' * len(batch))})", batch)
+            for key, mistakes, tags in rows:
+                found[key] = (mistakes, json.loads(tags))
+        if found:
+            now = time.time()
+            self.connection.executemany("UPDATE results SET last_used = ? WHERE key = ?",
+                                        [(now, key) for key in found])
+            self.connection.commit()
+        return found
+
+    def put_many(self, results: Iterable[Tuple[str, int, List[str]]]):
+        """Store (key, num_mistakes, mistake_tags) results and evict the oldest if over size."""
+        now = time.time()
+        self.connection.executemany(
+            "INSERT OR REPLACE INTO results (key, mistakes, tags, last_used) VALUES (?, ?, ?, ?)",
+            [(key, mistakes, json.dumps(tags), now) for key, mistakes, tags in results])
+        self.evict()
+        self.connection.commit()
+
+    def evict(self):
+        """Drop the least recently used results beyond max_entries."""
+        count, = self.connection.execute("SELECT COUNT(*) FROM results").fetchone()
+        if count > self.max_entries:
+            self.connection.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY last_used LIMIT ?)",
+                (count - self.max_entries,))
+
+    def invalidate(self):
+        """Forget every cached result."""
+        self.connection.execute("DELETE FROM results")
+        self.connection.commit()
+        self.connection.execute("VACUUM")
+
+    def close(self):
+        self.connection.close()
@@ -1,17 +1,30 @@
 import os
 import re
 import csv
+import json
+import hashlib
 import argparse
-import pandas
-from typing import List, Tuple
+import math
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+from contextlib import nullcontext
+from fnmatch import fnmatch
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+from typealong_cache import GradingCache, result_key
+import typealong_profile as profiling
 
 # add eol notes to readme
 # fix header comments
 
-def myers_diff(a, b):
-    """Compute the Myers diff between two sequences."""
+def myers_diff(a, b, limit=None):
+    """Compute the Myers diff between two sequences.
+
+    With a limit, gives up and returns None once the edit distance is known
+    to be more than limit.
+    """
     n, m = len(a), len(b)
-    max_d = n + m
+    max_d = n + m if limit is None else min(n + m, limit)
 
     v = {1: 0}
     trace = []
@@ -36,7 +49,7 @@ def myers_diff(a, b):
 
         trace.append(v.copy())
 
-    return []  # No solution found
+    return None  # Edit distance is over the limit
 
 def build_diff(a, b, trace):
     """Build the diff from the trace."""
@@ -71,21 +84,321 @@ def build_diff(a, b, trace):
 
     return list(reversed(diff))
 
+_LINEAR_SEGMENTS = 64
+_LINEAR_BASE_LAYERS = 64
+
+def to_runs(diff_results: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Run-length encode a character diff into (op, text) runs of consecutive equal ops."""
+    return [(op, ''.join(char for _, char in group)) for op, group in groupby(diff_results, key=itemgetter(0))]
+
+def expand_runs(runs: list) -> list:
+    """Turn (op, text) runs back into one (op, char) tuple per character."""
+    return [(op, char) for op, text in runs for char in text]
+
+def myers_runs(a: str, b: str, limit=None) -> Optional[List[Tuple[str, str]]]:
+    """The `myers_diff` of two strings as (op, text) runs."""
+    diff_results = myers_diff(a, b, limit)
+    return None if diff_results is None else to_runs(diff_results)
+
+def linear_myers_diff(a, b, limit=None):
+    """Compute the Myers diff between two sequences in linear space.
+
+    Produces exactly the same edit script as `myers_diff`, but instead of
+    copying the diagonal vector on every step it keeps a bounded number of
+    checkpoint layers and recovers the path segment by segment, recomputing
+    the layers between checkpoints on the way back. Takes the same limit.
+    The recomputation roughly doubles the search, which shows on files with
+    many mistakes, where `myers_diff` is faster if its memory can be spared.
+    """
+    runs = linear_myers_runs(a, b, limit)
+    return None if runs is None else expand_runs(runs)
+
+def linear_myers_runs(a, b, limit=None):
+    """The `linear_myers_diff` of two sequences as (op, slice) runs, built without per-item tuples."""
+    n, m = len(a), len(b)
+    offset = n + m + 1
+    v = [0] * (2 * offset + 1)
+
+    # The search starts from "layer -1", where diagonal 1 holds x = 0
+    k_end, checkpoints = _myers_layers(a, b, v, offset, (-1, [0]), n + m if limit is None else min(n + m, limit))
+    if k_end is None:
+        return None
+    steps = []
+    _linear_path(a, b, v, offset, checkpoints, k_end, steps)
+
+    # Runs as [op, sequence, start, end]; items with the same op in a row are contiguous
+    spans = []
+    x = y = 0
+    prev_k = 0
+    for k, x_end in reversed(steps):
+        if k == prev_k - 1:
+            _add_span(spans, 'insert', b, y, y + 1)
+            y += 1
+        elif k == prev_k + 1:
+            _add_span(spans, 'delete', a, x, x + 1)
+            x += 1
+        if x < x_end:
+            _add_span(spans, 'same', a, x, x_end)
+            y += x_end - x
+            x = x_end
+        prev_k = k
+    return [(op, seq[start:end]) for op, seq, start, end in spans]
+
+def _add_span(spans: list, op: str, seq, start: int, end: int):
+    if spans and spans[-1][0] == op:
+        spans[-1][3] = end
+    else:
+        spans.append([op, seq, start, end])
+
+def _myers_layers(a, b, v, offset, start, d_hi, stride=None):
+    """Run the forward Myers search from the start layer up to layer d_hi.
+
+    start is a (layer, values) snapshot of the diagonal vector, with values
+    beginning at diagonal -layer. Every stride-th layer is snapshotted the
+    same way; without a stride the spacing grows with the layer so an
+    open-ended search keeps O(_LINEAR_SEGMENTS) checkpoints per doubling.
+    Returns the diagonal that reached the end (or None) and the checkpoints,
+    which always include the start and the last layer searched.
+    """
+    n, m = len(a), len(b)
+    d_lo, values = start
+    v[offset - d_lo:offset - d_lo + len(values)] = values
+    checkpoints = [start]
+
+    for d in range(d_lo + 1, d_hi + 1):
+        for k in range(-d, d + 1, 2):
+            i = offset + k
+            if k == -d or (k != d and v[i - 1] < v[i + 1]):
+                x = v[i + 1]
+            else:
+                x = v[i - 1] + 1
+            y = x - k
+
+            while x < n and y < m and a[x] == b[y]:
+                x += 1
+                y += 1
+
+            v[i] = x
+
+            if x >= n and y >= m:
+                checkpoints.append((d, v[offset - d:offset + d + 1]))
+                return k, checkpoints
+
+        step = stride or max(1, (1 << d.bit_length()) // (2 * _LINEAR_SEGMENTS))
+        if d == d_hi or d % step == 0:
+            checkpoints.append((d, v[offset - d:offset + d + 1]))
+
+    return None, checkpoints
+
+def _linear_path(a, b, v, offset, checkpoints, k_hi, steps):
+    """Trace the path ending on diagonal k_hi back through the checkpoints.
+
+    Appends (diagonal, snake end) for every layer after the first checkpoint,
+    last layer first, and returns the path's diagonal on the first checkpoint.
+    """
+    k = k_hi
+    for (d_lo, lower), (d_hi, upper) in zip(checkpoints[-2::-1], checkpoints[:0:-1]):
+        span = d_hi - d_lo
+        if span > 1:
+            stride = 1 if span <= _LINEAR_BASE_LAYERS else -(-span // _LINEAR_SEGMENTS)
+            _, inner = _myers_layers(a, b, v, offset, (d_lo, lower), d_hi, stride)
+            k = _linear_path(a, b, v, offset, inner, k, steps)
+            continue
+
+        steps.append((k, upper[k + d_hi]))
+        if k == -d_hi or (k != d_hi and lower[k - 1 + d_lo] < lower[k + 1 + d_lo]):
+            k += 1
+        else:
+            k -= 1
+    return k
+
+# Unchanged lines kept on each side of a changed hunk so the character diff
+# can usually slide edits across line boundaries the way a full diff would
+_HUNK_CONTEXT_LINES = 2
+
+def hunked_diff(a: str, b: str, a_keys: List[int] = None, line_ids: dict = None,
+                limit: int = None) -> Optional[List[Tuple[str, str]]]:
+    """Diff two texts line by line first, then character by character inside changed hunks.
+
+    Lines are compared by integer id (a_keys and line_ids can be passed in when
+    a's ids were computed ahead of time). Runs of identical lines, less a few
+    lines of context, are emitted as 'same' directly and only the text between
+    them is diffed by character, so the cost follows the size of each hunk
+    rather than the whole file. Returns None once the hunks together need
+    more than limit edits.
+
+    The result is always a valid edit script, but not always the one the
+    full diff finds: when lines repeat, the line diff can pair them up
+    differently, or a hunk can end where the full diff would have moved an
+    edit past it, so the script can be longer and classify into more
+    mistakes.
+    """
+    runs = hunked_runs(a, b, a_keys, line_ids, limit=limit)
+    return None if runs is None else expand_runs(runs)
+
+def hunked_runs(a: str, b: str, a_keys: List[int] = None, line_ids: dict = None,
+                char_runs=linear_myers_runs, limit: int = None) -> Optional[List[Tuple[str, str]]]:
+    """The `hunked_diff` of two texts as (op, text) runs, with char_runs diffing each hunk."""
+    a_lines, b_lines = a.split('\n'), b.split('\n')
+    if line_ids is None:
+        line_ids = {}
+        a_keys = [line_ids.setdefault(line, len(line_ids)) for line in a_lines]
+    b_keys = [line_ids.get(line, -1) for line in b_lines]
+    n, m = len(a_keys), len(b_keys)
+
+    # Trim identical leading and trailing lines before the line diff
+    prefix = 0
+    while prefix < min(n, m) and a_keys[prefix] == b_keys[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(n, m) - prefix and a_keys[n - 1 - suffix] == b_keys[m - 1 - suffix]:
+        suffix += 1
+
+    # Collect runs of identical lines as (a line, b line, length)
+    runs = [(0, 0, prefix)]
+    i = j = prefix
+    for op, _ in linear_myers_diff(a_keys[prefix:n - suffix], b_keys[prefix:m - suffix]):
+        if op == 'same':
+            start_i, start_j, length = runs[-1]
+            if start_i + length == i and start_j + length == j:
+                runs[-1] = (start_i, start_j, length + 1)
+            else:
+                runs.append((i, j, 1))
+            i += 1
+            j += 1
+        elif op == 'delete':
+            i += 1
+        else:
+            j += 1
+    runs.append((n - suffix, m - suffix, suffix))
+
+    # Character offset of the start of every line (plus one past the end)
+    a_offsets, b_offsets = [0], [0]
+    for line in a_lines:
+        a_offsets.append(a_offsets[-1] + len(line) + 1)
+    for line in b_lines:
+        b_offsets.append(b_offsets[-1] + len(line) + 1)
+
+    script = []
+    edits = 0
+
+    def add_run(op, text):
+        if not text:
+            return
+        if script and script[-1][0] == op:
+            script[-1] = (op, script[-1][1] + text)
+        else:
+            script.append((op, text))
+
+    def diff_hunk(hunk_a, hunk_b):
+        nonlocal edits
+        hunk = char_runs(hunk_a, hunk_b, None if limit is None else limit - edits)
+        if hunk is None:
+            return False
+        for op, text in hunk:
+            if op != 'same':
+                edits += len(text)
+            add_run(op, text)
+        return True
+
+    a_pos = b_pos = 0
+    for i, j, length in runs:
+        lead = 0 if i == 0 and j == 0 else _HUNK_CONTEXT_LINES
+        trail = 0 if i + length == n and j + length == m else _HUNK_CONTEXT_LINES
+        if length - lead - trail <= 0:
+            continue
+        a_start, b_start = a_offsets[i + lead], b_offsets[j + lead]
+        a_end = min(a_offsets[i + length - trail], len(a))
+        if not diff_hunk(a[a_pos:a_start], b[b_pos:b_start]):
+            return None
+        add_run('same', a[a_start:a_end])
+        a_pos, b_pos = a_end, b_start + a_end - a_start
+    return script if diff_hunk(a[a_pos:], b[b_pos:]) else None
+
+DIFF_ENGINES = {
+    'classic': myers_diff,
+    'linear': linear_myers_diff,
+    'hunks': hunked_diff,
+}
+
+# The same engines, returning the edit script as (op, text) runs for classify_runs
+RUN_ENGINES = {
+    'classic': myers_runs,
+    'linear': linear_myers_runs,
+    'hunks': hunked_runs,
+}
+
+# One alternative per kind of non-code token; anything between matches is code.
+# Strings and char literals cannot span lines, and a literal or block comment
+# that is never closed is left as code, like javac's lexer would report it.
+_JAVA_TOKENS = re.compile(r'''
+      (?P<line_comment>//[^\n]*)
+    | (?P<block_comment>/\*[\s\S]*?\*/)
+    | (?P<string>"(?:\\.|[^"\\\n])*")
+    | (?P<char>'(?:\\.|[^'\\\n])*')
+''', re.VERBOSE)
+
+def lex_java(code: str) -> List[Tuple[str, str]]:
+    """Split Java code into (kind, text) tokens in a single scan.
+
+    kind is 'code', 'string', 'char', 'line_comment' or 'block_comment', and
+    joining the texts gives back the original code.
+    """
+    tokens = []
+    pos = 0
+    for match in _JAVA_TOKENS.finditer(code):
+        if match.start() > pos:
+            tokens.append(('code', code[pos:match.start()]))
+        tokens.append((match.lastgroup, match.group()))
+        pos = match.end()
+    if pos < len(code):
+        tokens.append(('code', code[pos:]))
+    return tokens
+
+def strip_comments(tokens: List[Tuple[str, str]], ignore_comments: str = 'none') -> str:
+    """Rebuild lexed code without the comments the ignore_comments level ignores.
+
+    'all' drops every comment; 'eol' drops only line comments that follow code
+    on the same line; 'none' keeps everything.
+    """
+    if ignore_comments not in ('all', 'eol'):
+        return ''.join(text for _, text in tokens)
+    parts = []
+    line_has_code = False
+    for kind, text in tokens:
+        if kind == 'line_comment' and (ignore_comments == 'all' or line_has_code):
+            continue
+        if kind == 'block_comment' and ignore_comments == 'all':
+            continue
+        parts.append(text)
+        if '\n' in text:
+            text = text[text.rindex('\n') + 1:]
+            line_has_code = False
+        line_has_code = line_has_code or bool(text.strip())
+    return ''.join(parts)
+
+_HEADER = re.compile(r'^.*?^(import|public\s+class)', re.DOTALL | re.MULTILINE)
+
+def lex_without_header(code: str) -> Tuple[List[Tuple[str, str]], int]:
+    """Remove the header (text before 'import' or 'public class') and lex the rest.
+
+    Returns the tokens and the number of lines the header took up, so line
+    numbers in the tokens can be mapped back to the student's file.
+    """
+    header = _HEADER.match(code)
+    start = header.start(1) if header else len(code) - len(code.lstrip())
+    return lex_java(code[start:].strip()), code[:start].count('\n')
+
+def normalize_java_code(code: str) -> str:
+    """Normalize line endings, replace tabs with spaces and drop trailing whitespace."""
+    return '\n'.join(line.rstrip().replace('\t', '    ')
+                     for line in code.replace('\r\n', '\n').replace('\r', '\n').split('\n'))
+
 def preprocess_java_code(code: str, ignore_comments: str = 'none') -> str:
     """Preprocess Java code by removing headers and optionally comments."""
-    # Remove header (text before 'import' or 'public class')
-    code = re.sub(r'^.*?^(import|public\s+class)', r'\1', code, flags=re.DOTALL | re.MULTILINE).strip()
-
-    # Remove comments based on the ignore_comments level
-    if ignore_comments == 'all':
-        code = re.sub(r'//.*?$|/\*.*?\*/', '', code, flags=re.MULTILINE | re.DOTALL)
-    elif ignore_comments == 'eol':
-        code = re.sub(r'^(.*\S)[ \t]*//.*$', r'\1', code, flags=re.MULTILINE)
-        
-    # Normalize line endings and replace tabs with spaces
-    return '\n'.join(line.rstrip().replace('\t', '    ') 
-                     for line in code.replace('\r\n', '\n').replace('\r', '\n').split('\n'))
-    
+    tokens, _ = lex_without_header(code)
+    return normalize_java_code(strip_comments(tokens, ignore_comments))
+
 
 def process_diff_results(diff_results: List[Tuple[str, str]]) -> dict:
     """Process the results of the Myers diff algorithm with more detailed mistake tracking."""
@@ -173,80 +486,683 @@ def process_diff_results(diff_results: List[Tuple[str, str]]) -> dict:
 
     return total_mistakes, mistake_tags
 
+# Runs of inserted or deleted spaces and newlines; anything else between them ends a group
+_WHITESPACE_GROUP = re.compile(r'[ \n]+')
+# What process_diff_results counts as a comment: every '/' or '*' straight after a '/' (or one of these)
+_COMMENT_MARKS = re.compile(r'/[/*]*')
+
+def classify_runs(runs: List[Tuple[str, str]]) -> tuple:
+    """Classify an edit script given as (op, text) runs, with the same result as process_diff_results.
+
+    Works on whole runs with string methods and regular expressions instead
+    of visiting every character in Python.
+    """
+    text_insertions = text_deletions = 0
+    # Edited characters in diff order, with unchanged text replaced by a separator
+    edited = []
+    for op, text in runs:
+        if op == 'same':
+            edited.append('\0')
+            continue
+        edited.append(text)
+        count = len(text) - text.count(' ') - text.count('\n')
+        if op == 'insert':
+            text_insertions += count
+        else:
+            text_deletions += count
+
+    # A group is a stretch of whitespace edits with no other change or unchanged text in between;
+    # it counts once for spaces and once for newlines, whether inserted or deleted
+    space_groups = newline_groups = 0
+    for group in _WHITESPACE_GROUP.findall(''.join(edited)):
+        space_groups += ' ' in group
+        newline_groups += '\n' in group
+
+    comment_count = sum(len(mark) - 1 for mark in _COMMENT_MARKS.findall(''.join(text for _, text in runs)))
+
+    total_mistakes = space_groups + newline_groups + text_insertions + text_deletions
+    mistake_tags = []
+    if space_groups > 0:
+        mistake_tags.append(f"SpacingErrors:{space_groups}")
+    if newline_groups > 0:
+        mistake_tags.append(f"NewLineErrors:{newline_groups}")
+    if text_insertions > 0:
+        mistake_tags.append(f"ExtraCharacters:{text_insertions}")
+    if text_deletions > 0:
+        mistake_tags.append(f"MissingCharacters:{text_deletions}")
+    if comment_count > 0:
+        mistake_tags.append(f"Comments:{comment_count}")
+
+    return total_mistakes, mistake_tags
+
+def blank_comments_and_strings(tokens: List[Tuple[str, str]]) -> str:
+    # Replace comments and literals with spaces, keeping newlines so line numbers stay consistent
+    return ''.join(text if kind == 'code' else re.sub(r'[^\n]', ' ', text) for kind, text in tokens)
+
 def remove_comments_and_strings(code):
-    # Pattern to match comments and strings
-    pattern = r'''
-        //.*?$              |   # Line comments
-        /\*[\s\S]*?\*/      |   # Block comments
-        "(?:\\.|[^"\\])*"   |   # Double-quoted strings
-        '(?:\\.|[^'\\])*'       # Single-quoted chars
-    '''
-    regex = re.compile(pattern, re.MULTILINE | re.VERBOSE)
-    # Replace matched patterns with spaces to keep line numbers consistent
-    return regex.sub(lambda m: ' ' * (m.end() - m.start()), code)
+    return blank_comments_and_strings(lex_java(code))
 
-def check_brackets(code: str):
-    # Remove comments and strings to avoid false positives
-    code_no_comments = remove_comments_and_strings(code)
-    lines = code_no_comments.split('\n')
-    errors = 0
-    for line_num, line in enumerate(lines):
+def find_bracket_errors(tokens: List[Tuple[str, str]], first_line: int = 1) -> List[int]:
+    """Line numbers (counting from first_line) of braces that are not in Allman style.
+
+    Comments and strings are blanked first to avoid false positives.
+    """
+    errors = []
+    for line_num, line in enumerate(blank_comments_and_strings(tokens).split('\n'), first_line):
         stripped_line = line.strip()
-        if not stripped_line:
-            continue  # Skip empty lines
-        if '{' in stripped_line or '}' in stripped_line:
-            # If the line is exactly '{' or '}', it's acceptable
-            if stripped_line == '{' or stripped_line == '}':
-                continue
-            else:
-                # If '{' or '}' is not alone on the line, it's not Allman style
-                errors += 1
-    # All braces are correctly placed in Allman style
+        # A brace is only acceptable when it is alone on its line
+        if ('{' in stripped_line or '}' in stripped_line) and stripped_line not in ('{', '}'):
+            errors.append(line_num)
     return errors
 
-def grade_java_code(source: str, student: str, ignore_comments: str = 'none') -> tuple:
-    """Compare two Java code snippets and return the difference count."""
-    processed_source = preprocess_java_code(source, ignore_comments)
-    processed_student = preprocess_java_code(student, ignore_comments)
-    
-    diff_results = myers_diff(processed_source, processed_student)
-    num_mistakes, mistake_tags = process_diff_results(diff_results)
+def check_brackets(code: str):
+    return len(find_bracket_errors(lex_java(code)))
+
+class PreparedReference:
+    """The teacher's code, read and preprocessed once and shared by every student comparison."""
+
+    def __init__(self, source: str, ignore_comments: str = 'none'):
+        self.ignore_comments = ignore_comments
+        self.text = preprocess_java_code(source, ignore_comments)
+        self.lines = self.text.split('\n')
+        # Each distinct line gets a small integer id so line-level comparisons
+        # against student code never have to re-compare whole strings
+        self.line_ids = {}
+        self.line_keys = [self.line_ids.setdefault(line, len(self.line_ids)) for line in self.lines]
+        self.char_counts = Counter(self.text)
+        self.digest = hashlib.sha256(f"{ignore_comments}:{self.text}".encode()).hexdigest()
+
+    @classmethod
+    def load(cls, path: str, ignore_comments: str = 'none') -> 'PreparedReference':
+        """Read and prepare the reference solution at path."""
+        with open(path, 'r') as src:
+            return cls(src.read(), ignore_comments)
 
-    if check_brackets(student) > 0:
-        mistake_tags.append(f"Brackets:{check_brackets(student)}")
+def _min_mistakes(a_counts: Counter, b_counts: Counter) -> int:
+    """Fewest mistakes any diff between texts with these character counts can find.
+
+    Runs of spaces and newlines count as one mistake, but every other inserted
+    or deleted character is a mistake of its own, and a character one side has
+    more of must be inserted or deleted.
+    """
+    return sum(abs(a_counts[char] - b_counts[char]) for char in a_counts.keys() | b_counts.keys()
+               if char not in ' \n')
+
+def grade_java_code(source: Union[str, PreparedReference], student: str, ignore_comments: str = 'none',
+                    engine: str = 'linear', max_mistakes: int = None, max_edits: int = None) -> tuple:
+    """Compare two Java code snippets and return the difference count.
+
+    source may be a PreparedReference, in which case its own ignore_comments
+    level is used and the teacher's code is not preprocessed again.
+
+    With max_mistakes, a student certain to have more mistakes than that is
+    not diffed in full; with max_edits, neither is one whose edit distance
+    from the reference is more than that. Either way the result is tagged
+    ExceedsThreshold, which score_student scores as 0, and only counts the
+    mistakes the student is certain to have.
+    """
+    reference = source if isinstance(source, PreparedReference) else PreparedReference(source, ignore_comments)
+    # Lex the student's code once for both the diff and the brace style check
+    with profiling.stage('preprocess'):
+        tokens, header_lines = lex_without_header(student)
+        processed_student = normalize_java_code(strip_comments(tokens, reference.ignore_comments))
+    with profiling.stage('brackets'):
+        bracket_errors = find_bracket_errors(tokens, header_lines + 1)
+
+    limit = max_edits
+    min_mistakes = 0
+    if max_mistakes is not None:
+        student_counts = Counter(processed_student)
+        min_mistakes = _min_mistakes(reference.char_counts, student_counts)
+        # Past this edit distance even a diff that is all whitespace edits, bar
+        # max_mistakes of them, has more than max_mistakes mistakes
+        whitespace = sum(counts[char] for counts in (reference.char_counts, student_counts) for char in ' \n')
+        certain_limit = max_mistakes + whitespace
+        limit = certain_limit if max_edits is None else min(max_edits, certain_limit)
+
+    with profiling.stage('diff'):
+        if max_mistakes is not None and min_mistakes > max_mistakes:
+            runs = None
+        elif engine == 'hunks':
+            runs = hunked_runs(reference.text, processed_student, reference.line_keys, reference.line_ids,
+                               limit=limit)
+        else:
+            runs = RUN_ENGINES[engine](reference.text, processed_student, limit)
+
+    if runs is None:
+        if max_mistakes is None:
+            min_mistakes = _min_mistakes(reference.char_counts, Counter(processed_student))
+        elif limit == certain_limit:
+            min_mistakes = max(min_mistakes, max_mistakes + 1)
+        num_mistakes, mistake_tags = min_mistakes, ["ExceedsThreshold"]
+    else:
+        with profiling.stage('classify'):
+            num_mistakes, mistake_tags = classify_runs(runs)
+
+    if bracket_errors:
+        mistake_tags.append(f"Brackets:{len(bracket_errors)}")
+        mistake_tags.append(f"BracketLines:{','.join(map(str, bracket_errors))}")
     
     return (num_mistakes, mistake_tags)
 
-def get_student_name(file_path: str) -> str:
-    """Extract student name from the first line of the file."""
-    with open(file_path, 'r') as file:
-        return ''.join(c for c in file.readline().strip() if c.isalnum())
-
-def find_java_files(directory: str) -> List[Tuple[str, str]]:
-    """Find all Java files in the given directory with student names."""
-    java_files = []
-    for root, _, files in os.walk(directory):
-        for file in files:
-            if file.endswith('.java'):
-                file_path = os.path.join(root, file)
-                student_name = get_student_name(file_path)
-                java_files.append((student_name, file_path))
-    return java_files
-
-def grade_typealong(source_code: str, student_files: List[Tuple[str, str]], 
-                    total_points: float, points_per_mistake: float = 0.1, ignore_comments: str = 'eol') -> List[Tuple[str, float]]:
-    """Grade type-along assignments."""
-    grades = []
-    for student_name, student_file in student_files:
-        with open(source_code, 'r') as src, open(student_file, 'r') as student:
-            num_mistakes, mistake_tags = grade_java_code(src.read(), student.read(), ignore_comments=ignore_comments)
-        if "conlin" in student_name.lower():
-            num_mistakes = num_mistakes+1
-            mistake_tags.append("CopiedConlinName")
-        score = max(0, total_points - (num_mistakes * points_per_mistake))
-        grades.append((student_name, round(score, 2), mistake_tags))
+def student_runs(reference: PreparedReference, student: str, engine: str = 'linear') -> List[Tuple[str, str]]:
+    """The edit script from the reference to a student's code, as (op, text) runs, preprocessed as for grading."""
+    tokens, _ = lex_without_header(student)
+    processed_student = normalize_java_code(strip_comments(tokens, reference.ignore_comments))
+    if engine == 'hunks':
+        return hunked_runs(reference.text, processed_student, reference.line_keys, reference.line_ids)
+    return RUN_ENGINES[engine](reference.text, processed_student)
+
+def side_by_side(runs: List[Tuple[str, str]]) -> List[Tuple[List[Tuple[str, str]], List[Tuple[str, str]]]]:
+    """Pair up the lines of the reference and the student's code for showing an edit script side by side.
+
+    Returns (reference line, student line) pairs, each line a list of (op,
+    text) segments: 'same' text is on both sides, 'delete' only in the
+    reference and 'insert' only in the student's code. An inserted or
+    deleted line break is kept as a '\n' segment at the end of its line.
+    Lines are lined up at every unchanged line break, padding the side
+    with fewer lines since the last one with empty lines.
+    """
+    pairs = []
+    left, right = [[]], [[]]
+    for op, text in runs:
+        for n, part in enumerate(text.split('\n')):
+            if n > 0:
+                if op == 'same':
+                    left.extend([] for _ in range(len(right) - len(left)))
+                    right.extend([] for _ in range(len(left) - len(right)))
+                    pairs.extend(zip(left, right))
+                    left, right = [[]], [[]]
+                else:
+                    lines = left if op == 'delete' else right
+                    lines[-1].append((op, '\n'))
+                    lines.append([])
+            if part:
+                if op != 'insert':
+                    left[-1].append((op, part))
+                if op != 'delete':
+                    right[-1].append((op, part))
+    left.extend([] for _ in range(len(right) - len(left)))
+    right.extend([] for _ in range(len(left) - len(right)))
+    pairs.extend(zip(left, right))
+    return pairs
+
+def student_name_from_code(code: str) -> str:
+    """Extract student name from the first line of their code."""
+    return ''.join(c for c in code.split('\n', 1)[0].strip() if c.isalnum())
+
+def _matches(path: str, patterns: Iterable[str]) -> bool:
+    name = os.path.basename(path)
+    return any(fnmatch(name, pattern) or fnmatch(path, pattern) for pattern in patterns)
+
+def scan_java_files(directory: str, include: Iterable[str] = ('*.java',), exclude: Iterable[str] = (),
+                    max_size: int = None) -> List[str]:
+    """List the files under directory to grade, in the same order os.walk would find them.
+
+    include and exclude are glob patterns matched against each file's name
+    and its path relative to directory (with '/' separators); exclude also
+    matches directories, which are then not searched at all. Files larger
+    than max_size bytes are skipped without being read.
+    """
+    include, exclude = list(include), list(exclude)
+    found = []
+
+    def scan(path: str, relative: str):
+        try:
+            with os.scandir(path) as entries:
+                entries = list(entries)
+        except OSError:
+            return  # Unreadable directories are skipped, like os.walk does
+        directories = []
+        for entry in entries:
+            entry_relative = f"{relative}/{entry.name}" if relative else entry.name
+            try:
+                is_dir = entry.is_dir()
+            except OSError:
+                is_dir = False
+            if _matches(entry_relative, exclude):
+                continue
+            if is_dir:
+                if not entry.is_symlink():
+                    directories.append((entry.path, entry_relative))
+            elif _matches(entry_relative, include):
+                try:
+                    if max_size is not None and entry.stat().st_size > max_size:
+                        continue
+                except OSError:
+                    continue
+                found.append(entry.path)
+        for directory_path, directory_relative in directories:
+            scan(directory_path, directory_relative)
+
+    scan(directory, '')
+    return found
+
+def read_student_file(file_path: str) -> Tuple[str, str, Optional[str]]:
+    """Read a student's file once, returning (student name, path, code).
+
+    A file that cannot be read as text is named after the file instead and
+    has no code, so grading it reports the error.
+    """
+    try:
+        with open(file_path, 'r') as file:
+            code = file.read()
+    except (OSError, ValueError):
+        return (os.path.splitext(os.path.basename(file_path))[0], file_path, None)
+    return (student_name_from_code(code), file_path, code)
+
+def find_java_files(directory: str, include: Iterable[str] = ('*.java',), exclude: Iterable[str] = (),
+                    max_size: int = None, io_jobs: int = 8) -> List[Tuple[str, str, Optional[str]]]:
+    """Find all Java files in the given directory with student names, reading each one once.
+
+    Returns (student name, path, code) for each file; see scan_java_files for
+    the filters. Files are read on io_jobs threads, which helps most on
+    network-mounted course shares.
+    """
+    with profiling.stage('find_files'):
+        paths = scan_java_files(directory, include, exclude, max_size)
+    with profiling.stage('read_files'):
+        if io_jobs <= 1 or len(paths) <= 1:
+            return [read_student_file(path) for path in paths]
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=io_jobs) as executor:
+            return list(executor.map(read_student_file, paths))
+
+def grade_file(reference: PreparedReference, student_file: str, engine: str = 'linear',
+               max_mistakes: int = None, max_edits: int = None,
+               code: str = None) -> Tuple[Optional[int], List[str]]:
+    """Grade one student file, returning (num_mistakes, mistake_tags).
+
+    The file is only read if its code is not passed in. A file that fails to
+    grade gives (None, ["GradingError:<exception>"]) instead of raising.
+    """
+    try:
+        with profiling.student(student_file):
+            if code is None:
+                with profiling.stage('read'), open(student_file, 'r') as student:
+                    code = student.read()
+            return grade_java_code(reference, code, engine=engine, max_mistakes=max_mistakes, max_edits=max_edits)
+    except Exception as e:
+        return (None, [f"GradingError:{type(e).__name__}"])
+
+def score_student(student_name: str, num_mistakes: Optional[int], mistake_tags: List[str],
+                  total_points: float, points_per_mistake: float = 0.1) -> Tuple[str, float, List[str]]:
+    """Turn a student's mistakes into the (name, score, tags) row that gets reported.
+
+    Students tagged ExceedsThreshold score 0, since grading stopped before
+    their mistakes were all counted.
+    """
+    if num_mistakes is None:
+        return (student_name, 0, mistake_tags)
+    mistake_tags = list(mistake_tags)
+    if "conlin" in student_name.lower():
+        num_mistakes = num_mistakes+1
+        mistake_tags.append("CopiedConlinName")
+    if "ExceedsThreshold" in mistake_tags:
+        return (student_name, 0, mistake_tags)
+    score = max(0, total_points - (num_mistakes * points_per_mistake))
+    return (student_name, round(score, 2), mistake_tags)
+
+def zero_score_mistakes(total_points: float, points_per_mistake: float) -> Optional[int]:
+    """Number of mistakes past which a student scores 0, or None if no number of mistakes does."""
+    if points_per_mistake <= 0:
+        return None
+    return max(0, math.ceil(total_points / points_per_mistake))
+
+# References handed to each worker process once, when the pool starts, keyed by digest
+_worker_references = {}
+
+def init_worker(references: dict):
+    """Start a worker process with the references grade_chunk uses by default, as the pool's initializer."""
+    global _worker_references
+    _worker_references = references
+
+def grade_chunk(items: List[tuple], references: dict = None, engine: str = 'linear',
+                max_edits: int = None) -> list:
+    """Grade a contiguous chunk of (reference digest, path, code, max_mistakes) items.
+
+    The references default to the ones shared with the worker.
+    """
+    references = references or _worker_references
+    return [grade_file(references[digest], student_file, engine, max_mistakes, max_edits, code)
+            for digest, student_file, code, max_mistakes in items]
+
+def _new_pool(jobs: int, references: dict):
+    from concurrent.futures import ProcessPoolExecutor
+    return ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(references,))
+
+def _grade_alone(references: dict, chunk: List[tuple], engine: str, max_edits: int = None) -> list:
+    """Grade a chunk that may have killed its worker process, one student per fresh process if it does again."""
+    def run(items):
+        with _new_pool(1, references) as pool:
+            return pool.submit(grade_chunk, items, engine=engine, max_edits=max_edits).result()
+
+    try:
+        return run(chunk)
+    except Exception:
+        results = []
+        for item in chunk:
+            try:
+                results.extend(run([item]))
+            except Exception as e:
+                results.append((None, [f"GradingError:{type(e).__name__}"]))
+        return results
+
+def _iter_recovered(references: dict, chunks: List[Tuple[int, List[tuple]]], engine: str, jobs: int,
+                    max_edits: int = None) -> Iterator[Tuple[int, tuple]]:
+    """Grade the (start, chunk) pairs left unfinished when a worker process died, yielding as _iter_graded does."""
+    from concurrent.futures import FIRST_COMPLETED, wait
+    from concurrent.futures.process import BrokenProcessPool
+
+    waiting = list(reversed(chunks))
+    running = {}
+    pool = _new_pool(jobs, references)
+    try:
+        while waiting or running:
+            while waiting and len(running) < jobs:
+                start, chunk = waiting.pop()
+                running[pool.submit(grade_chunk, chunk, engine=engine, max_edits=max_edits)] = (start, chunk)
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            if any(isinstance(future.exception(), BrokenProcessPool) for future in done):
+                # Every chunk still running fails along with the pool
+                done, _ = wait(running)
+            suspects = []
+            for future in done:
+                start, chunk = running.pop(future)
+                try:
+                    results = future.result()
+                except BrokenProcessPool:
+                    suspects.append((start, chunk))
+                    continue
+                except Exception as e:
+                    results = [(None, [f"GradingError:{type(e).__name__}"])] * len(chunk)
+                for offset, result in enumerate(results):
+                    yield start + offset, result
+            if suspects:
+                pool.shutdown()
+                for start, chunk in sorted(suspects):
+                    for offset, result in enumerate(_grade_alone(references, chunk, engine, max_edits)):
+                        yield start + offset, result
+                pool = _new_pool(jobs, references)
+    finally:
+        for future in running:
+            future.cancel()
+        pool.shutdown()
+
+def _iter_graded(references: dict, items: List[tuple], engine: str, jobs: int,
+                 max_edits: int = None, executor=None) -> Iterator[Tuple[int, tuple]]:
+    """Grade (reference digest, path, code, max_mistakes) items, yielding (position, result) as each finishes.
+
+    Grades on a process pool (or the given executor) unless there is one
+    job or a profile is being recorded. Closing the generator early cancels
+    the chunks that have not started.
+    """
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    if executor is None and (jobs <= 1 or len(items) <= 1 or profiling.active() is not None):
+        for i, (digest, student_file, code, max_mistakes) in enumerate(items):
+            yield i, grade_file(references[digest], student_file, engine, max_mistakes, max_edits, code)
+        return
+
+    # Only imported here, since multiprocessing is slow to import and most runs grade serially
+    from concurrent.futures import as_completed
+    from concurrent.futures.process import BrokenProcessPool
+
+    # Several chunks per worker keeps the pool busy when file sizes are uneven
+    chunk_size = max(1, len(items) // (jobs * 4))
+    own_executor = executor is None
+    if own_executor:
+        executor = _new_pool(jobs, references)
+    futures = {}
+    unfinished = []
+    try:
+        for start in range(0, len(items), chunk_size):
+            chunk = items[start:start + chunk_size]
+            chunk_references = None if own_executor else {digest: references[digest] for digest, *_ in chunk}
+            try:
+                futures[executor.submit(grade_chunk, chunk, chunk_references, engine=engine,
+                                        max_edits=max_edits)] = (start, chunk)
+            except BrokenProcessPool:
+                unfinished.append((start, chunk))
+        for future in as_completed(futures):
+            start, chunk = futures[future]
+            try:
+                results = future.result()
+            except BrokenProcessPool:
+                unfinished.append((start, chunk))
+                continue
+            except Exception as e:
+                results = [(None, [f"GradingError:{type(e).__name__}"])] * len(chunk)
+            for offset, result in enumerate(results):
+                yield start + offset, result
+    finally:
+        for future in futures:
+            future.cancel()
+        if own_executor:
+            executor.shutdown()
+
+    if unfinished:
+        # A worker that died (crashed, or killed for running out of memory) broke the whole pool. Its
+        # chunks are regraded on fresh pools at most jobs at a time, so a chunk that breaks one again
+        # is a suspect; suspects are regraded alone, then a student at a time, so only the student
+        # whose file kills the process gets a GradingError
+        yield from _iter_recovered(references, sorted(unfinished), engine, jobs, max_edits)
+
+def _code(student_file: tuple) -> Optional[str]:
+    """The code already read for a (name, path) or (name, path, code) entry, if any."""
+    return student_file[2] if len(student_file) > 2 else None
+
+def iter_mistakes(work: List[Tuple[PreparedReference, tuple, float, float]], engine: str = 'linear', jobs: int = 1,
+                  cache: GradingCache = None, bounded: bool = False, max_edits: int = None,
+                  executor=None) -> Iterator[Tuple[int, Tuple[Optional[int], List[str]]]]:
+    """Grade (reference, student entry, total_points, points_per_mistake) items against their own references.
+
+    Yields (index into work, (num_mistakes, mistake_tags)) as each student
+    finishes, before anything is scored, so the results can be kept and
+    scored again with other points. The points only matter here for
+    bounded and max_edits grading. With an executor (a ProcessPoolExecutor
+    kept running between calls, as typealong_service does), students are
+    graded on it instead of on a pool started for this call.
+    """
+    references = {reference.digest: reference for reference, _, _, _ in work}
+    limits = [None] * len(work)
+    settings = [engine] * len(work)
+    if bounded or max_edits is not None:
+        for i, (_, _, total_points, points_per_mistake) in enumerate(work):
+            limits[i] = zero_score_mistakes(total_points, points_per_mistake)
+            # Cut-off results depend on the limits, so they are cached separately
+            settings[i] = f"{engine}:max_mistakes={limits[i]}:max_edits={max_edits}"
+
+    keys = [None] * len(work)
+    pending = list(range(len(work)))
+    if cache is not None:
+        keys = [result_key(reference.digest, entry[1], settings[i], _code(entry))
+                for i, (reference, entry, _, _) in enumerate(work)]
+        cached = cache.get_many(keys)
+        pending = []
+        for i, key in enumerate(keys):
+            if key in cached:
+                yield i, cached[key]
+            else:
+                pending.append(i)
+
+    items = [(work[i][0].digest, work[i][1][1], _code(work[i][1]), limits[i]) for i in pending]
+    fresh = []
+    try:
+        for position, (num_mistakes, mistake_tags) in _iter_graded(references, items, engine, jobs, max_edits,
+                                                                    executor):
+            i = pending[position]
+            if keys[i] is not None and num_mistakes is not None:
+                fresh.append((keys[i], num_mistakes, mistake_tags))
+            yield i, (num_mistakes, mistake_tags)
+    finally:
+        if cache is not None and fresh:
+            cache.put_many(fresh)
+
+def iter_grades(work: List[Tuple[PreparedReference, tuple, float, float]], engine: str = 'linear', jobs: int = 1,
+                cache: GradingCache = None, bounded: bool = False, max_edits: int = None,
+                executor=None) -> Iterator[Tuple[int, Tuple[str, float, List[str]]]]:
+    """Grade and score work items as iter_mistakes does, yielding (index into work, grade).
+
+    This is what iter_typealong runs for one assignment, and it lets
+    students from several assignments share one process pool and cache.
+    """
+    results = iter_mistakes(work, engine, jobs, cache, bounded, max_edits, executor)
+    try:
+        for i, (num_mistakes, mistake_tags) in results:
+            _, entry, total_points, points_per_mistake = work[i]
+            yield i, score_student(entry[0], num_mistakes, mistake_tags, total_points, points_per_mistake)
+    finally:
+        results.close()
+
+def iter_typealong(source_code: Union[str, PreparedReference], student_files: List[tuple],
+                   total_points: float, points_per_mistake: float = 0.1, ignore_comments: str = 'eol',
+                   engine: str = 'linear', jobs: int = 1, cache: GradingCache = None, bounded: bool = False,
+                   max_edits: int = None) -> Iterator[Tuple[int, Tuple[str, float, List[str]]]]:
+    """Grade type-along assignments, yielding (index into student_files, grade) as each student finishes.
+
+    Takes the same arguments as grade_typealong. Cached students come first;
+    with a process pool the rest arrive in completion order. Stopping early
+    still stores every result graded so far in the cache.
+    """
+    if isinstance(source_code, PreparedReference):
+        reference = source_code
+    else:
+        with profiling.stage('reference'):
+            reference = PreparedReference.load(source_code, ignore_comments)
+
+    yield from iter_grades([(reference, entry, total_points, points_per_mistake) for entry in student_files],
+                           engine, jobs, cache, bounded, max_edits)
+
+def grade_typealong(source_code: Union[str, PreparedReference], student_files: List[tuple], 
+                    total_points: float, points_per_mistake: float = 0.1, ignore_comments: str = 'eol',
+                    engine: str = 'linear', jobs: int = 1, cache: GradingCache = None, bounded: bool = False,
+                    max_edits: int = None) -> List[Tuple[str, float]]:
+    """Grade type-along assignments.
+
+    source_code is a path or a PreparedReference, and student_files holds
+    (name, path) or (name, path, code) entries; grades keep their order.
+    jobs > 1 grades on a process pool (0 uses every core), a cache skips
+    files already graded with the same settings, and bounded and max_edits
+    give students past them 0, tagged ExceedsThreshold.
+    """
+    grades = [None] * len(student_files)
+    for i, grade in iter_typealong(source_code, student_files, total_points, points_per_mistake,
+                                   ignore_comments, engine, jobs, cache, bounded, max_edits):
+        grades[i] = grade
     return grades
 
+def in_student_order(results: Iterator[Tuple[int, tuple]]) -> Iterator[Tuple[int, tuple]]:
+    """Put the (index, grade) pairs from iter_typealong back in student order.
+
+    Only grades that finish ahead of an earlier student are held back.
+    """
+    waiting = {}
+    next_index = 0
+    try:
+        for i, grade in results:
+            waiting[i] = grade
+            while next_index in waiting:
+                yield next_index, waiting.pop(next_index)
+                next_index += 1
+    finally:
+        results.close()
+
+class StreamingResultWriter:
+    """Write grades to a CSV, TSV or JSON Lines file one row at a time.
+
+    Every row is flushed as soon as it is written, so a crashed or cancelled
+    run still leaves the students graded so far on disk. The format follows
+    the file extension unless output_format is given.
+    """
+    FORMATS = {'.csv': 'csv', '.tsv': 'tsv', '.jsonl': 'jsonl'}
+
+    def __init__(self, path: str, columns: List[str] = ("StudentName", "Score", "Mistakes"),
+                 output_format: str = None):
+        self.output_format = output_format or self.FORMATS.get(os.path.splitext(path)[1].lower(), 'csv')
+        self.columns = list(columns)
+        if self.output_format == 'jsonl':
+            self.file = open(path, 'w')
+        else:
+            self.file = open(path, 'w', newline='')
+            self.writer = csv.writer(self.file, delimiter='\t' if self.output_format == 'tsv' else ',')
+            self.writer.writerow(self.columns)
+            self.file.flush()
+
+    def write(self, row: tuple):
+        if self.output_format == 'jsonl':
+            self.file.write(json.dumps(dict(zip(self.columns, row))) + '\n')
+        else:
+            self.writer.writerow(row)
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+DIFF_ENGINE_HELP = ("linear uses little memory, classic is faster on badly mistyped files but uses far more "
+                    "memory, hunks is fastest on long files but can count a few extra mistakes when lines repeat")
+
+def add_grading_options(parser: argparse.ArgumentParser, local: bool = True):
+    """Add the diff, file, cut-off and output format options every command line grader shares.
+
+    local adds the ones that only apply when grading in this process: the
+    results cache, the reading threads and similarity groups.
+    """
+    parser.add_argument("--diff_engine", choices=sorted(DIFF_ENGINES), default="linear",
+                        help=f"Diff implementation to use: {DIFF_ENGINE_HELP} (default: linear)")
+    parser.add_argument("--include", action="append", default=None, metavar="GLOB",
+                        help="Only grade files matching this glob; may be repeated (default: *.java)")
+    parser.add_argument("--exclude", action="append", default=[], metavar="GLOB",
+                        help="Skip files and directories matching this glob; may be repeated")
+    parser.add_argument("--max_file_size", type=int, default=None,
+                        help="Skip files larger than this many bytes without reading them")
+    parser.add_argument("--bounded", action="store_true",
+                        help="Stop diffing a student once they are certain to score 0 (tagged ExceedsThreshold)")
+    parser.add_argument("--max_edits", type=int, default=None,
+                        help="Give students more than this many edits from the reference a 0 (tagged ExceedsThreshold)")
+    parser.add_argument("--format", choices=["csv", "tsv", "jsonl"], default=None,
+                        help="Output format (default: from the --output extension, otherwise csv)")
+    if not local:
+        return
+    parser.add_argument("--io_jobs", type=int, default=8,
+                        help="Number of threads reading student files (default: 8)")
+    parser.add_argument("--cache", default=None,
+                        help="Path to a results cache file; unchanged submissions are not regraded")
+    parser.add_argument("--cache_size", type=int, default=100000,
+                        help="Maximum number of results kept in the cache (default: 100000)")
+    parser.add_argument("--similarity", action="store_true",
+                        help="Add a SimilarGroup column numbering groups of students who share several unusual "
+                             "mistakes, which can be a sign of copying")
+    parser.add_argument("--similarity_min_shared", type=int, default=3,
+                        help="Unusual mistakes two students must share to be grouped by --similarity (default: 3)")
+
+def watch(args, cache: GradingCache = None):
+    """Regrade the student directory as files land, rewriting the output after every change, until Ctrl+C."""
+    from typealong_watch import SubmissionWatcher, write_results
+
+    watcher = SubmissionWatcher(args.source_code, args.student_directory, args.total_points,
+                                args.points_per_mistake, args.ignore_comments, args.diff_engine, args.jobs, cache,
+                                args.bounded, args.max_edits, args.include or ['*.java'], args.exclude,
+                                args.max_file_size)
+    print(f"Watching {args.student_directory} for new or changed files (Ctrl+C to stop)")
+    try:
+        for changes in watcher.watch(args.watch_interval):
+            write_results(args.output, watcher.results(), output_format=args.format)
+            for path, grade in changes:
+                if grade is None:
+                    print(f"Removed {path}")
+                else:
+                    print(f"Graded {grade[0]}: {grade[1]} ({path})")
+    except KeyboardInterrupt:
+        pass
+    print(f"Stopped watching. Results saved to {args.output}")
+
 def main():
     """Main function to parse arguments and grade type-along assignments."""
     parser = argparse.ArgumentParser(description="Grade student type-along assignments")
@@ -256,21 +1172,84 @@ def main():
     parser.add_argument("--points_per_mistake", type=float, default=0.1, 
                         help="Points deducted per mistake (default: 0.1)")
     parser.add_argument("--ignore_comments", type=str, default="eol")
+    parser.add_argument("--jobs", type=int, default=1,
+                        help="Number of worker processes to grade with, 0 for all cores (default: 1)")
+    add_grading_options(parser)
+    parser.add_argument("--invalidate_cache", action="store_true",
+                        help="Clear the results cache before grading")
     parser.add_argument("--output", default="typealong-graded.csv", 
                         help="Path to the output CSV file (default: typealong-graded.csv)")
+    parser.add_argument("--watch", action="store_true",
+                        help="Keep running and regrade files as they are added or changed, rewriting the output")
+    parser.add_argument("--watch_interval", type=float, default=0.5,
+                        help="Seconds between checks for new or changed files in --watch mode (default: 0.5)")
+    parser.add_argument("--session", default=None,
+                        help="Also save the raw results to this session file, to rescore or export later "
+                             "with typealong_results.py or the GUI without grading again")
+    parser.add_argument("--profile", default=None,
+                        help="Time each grading stage and student and save a JSON report to this path "
+                             "(grades in a single process)")
 
     args = parser.parse_args()
+    if args.watch and args.similarity:
+        parser.error("--similarity compares the whole class, so it cannot be used with --watch")
+
+    cache = GradingCache(args.cache, args.cache_size) if args.cache else None
+    if cache is not None and args.invalidate_cache:
+        cache.invalidate()
 
-    student_files = find_java_files(args.student_directory)
-    grades = grade_typealong(args.source_code, student_files, 
-                             args.total_points, args.points_per_mistake, args.ignore_comments)
+    if args.watch:
+        try:
+            watch(args, cache)
+        finally:
+            if cache is not None:
+                cache.close()
+        return
 
-    with open(args.output, 'w', newline='') as csvfile:
-        writer = csv.writer(csvfile)
-        writer.writerow(["StudentName", "Score", "Mistakes"])
-        writer.writerows(grades)
+    profile = profiling.GradingProfile() if args.profile else None
+    with profile if profile is not None else nullcontext():
+        student_files = find_java_files(args.student_directory, args.include or ['*.java'], args.exclude,
+                                        args.max_file_size, args.io_jobs)
+        columns = ["StudentName", "Score", "Mistakes"]
+        if args.similarity:
+            from typealong_similarity import similarity_groups
+            with open(args.source_code, 'r') as src, profiling.stage('similarity'):
+                groups = similarity_groups(src.read(), student_files, min_shared=args.similarity_min_shared)
+            columns.append("SimilarGroup")
+        store = None
+        if args.session:
+            from typealong_results import ResultStore, code_digest
+            store = ResultStore({'source_code': os.path.abspath(args.source_code),
+                                 'student_directory': os.path.abspath(args.student_directory),
+                                 'total_points': args.total_points, 'points_per_mistake': args.points_per_mistake,
+                                 'ignore_comments': args.ignore_comments, 'engine': args.diff_engine,
+                                 'bounded': args.bounded, 'max_edits': args.max_edits})
+        with profiling.stage('reference'):
+            reference = PreparedReference.load(args.source_code, args.ignore_comments)
+        work = [(reference, entry, args.total_points, args.points_per_mistake) for entry in student_files]
+        # Rows are written as students finish, so partial results survive a crash
+        try:
+            with StreamingResultWriter(args.output, columns, args.format) as writer:
+                for i, (num_mistakes, mistake_tags) in in_student_order(iter_mistakes(
+                        work, args.diff_engine, args.jobs, cache, args.bounded, args.max_edits)):
+                    name, path = student_files[i][:2]
+                    if store is not None:
+                        store.put(name, path, num_mistakes, mistake_tags, code_digest(_code(student_files[i])))
+                    grade = score_student(name, num_mistakes, mistake_tags, args.total_points,
+                                          args.points_per_mistake)
+                    with profiling.stage('export'):
+                        writer.write(grade + (groups[i],) if args.similarity else grade)
+        finally:
+            if cache is not None:
+                cache.close()
+            if store is not None:
+                store.save(args.session)
 
     print(f"Grading complete. Results saved to {args.output}")
+    if profile is not None:
+        profile.write(args.profile)
+        print(profile.summary())
+        print(f"Profile saved to {args.profile}")
 
 if __name__ == "__main__":
     main()
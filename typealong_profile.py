@@ -0,0 +1,129 @@
+import json
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional
+
+# The profile being recorded, if any; grading code reports to it through stage() and student()
+_active = None
+
+def stage(name: str):
+    """Time a stage of grading (and its peak memory) if a profile is being recorded."""
+    return _active.stage(name) if _active is not None else nullcontext()
+
+def student(student_file: str):
+    """Attribute the stages run inside this block to one student's file."""
+    return _active.student(student_file) if _active is not None else nullcontext()
+
+def active() -> Optional['GradingProfile']:
+    return _active
+
+class GradingProfile:
+    """Wall time and peak memory of each stage of a grading run, overall and per student.
+
+    Use as a context manager around the run. Stages can nest (a student's
+    stages all run inside it), so stage totals are not meant to add up.
+    Memory is traced with tracemalloc, which slows grading down noticeably.
+    """
+
+    def __init__(self, track_memory: bool = True):
+        self.track_memory = track_memory
+        self.stages: Dict[str, dict] = {}
+        self.students: Dict[str, dict] = {}
+        self.current_student = None
+        # Peak memory seen so far by each stage that is running, innermost last
+        self.open_peaks: List[int] = []
+        self.started = None
+        self.seconds = 0.0
+        self.peak_bytes = 0
+
+    def __enter__(self):
+        global _active
+        import tracemalloc  # Slow to import, and only needed once a profile is recorded
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        self.started = time.perf_counter()
+        _active = self
+        return self
+
+    def __exit__(self, *exc_info):
+        global _active
+        _active = None
+        import tracemalloc
+        self.seconds = time.perf_counter() - self.started
+        if self.track_memory and tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def _peak(self) -> int:
+        import tracemalloc
+        return tracemalloc.get_traced_memory()[1] if tracemalloc.is_tracing() else 0
+
+    @contextmanager
+    def stage(self, name: str):
+        import tracemalloc
+        # Resetting the peak would lose the outer stage's peak so far, so hand it over first.
+        # reset_peak only exists from Python 3.9; before that peaks are since the run started
+        if self.open_peaks:
+            self.open_peaks[-1] = max(self.open_peaks[-1], self._peak())
+        if tracemalloc.is_tracing() and hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        self.open_peaks.append(0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            peak = max(self.open_peaks.pop(), self._peak())
+            if self.open_peaks:
+                self.open_peaks[-1] = max(self.open_peaks[-1], peak)
+            self.peak_bytes = max(self.peak_bytes, peak)
+            totals = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peak_bytes': 0})
+            totals['calls'] += 1
+            totals['seconds'] += seconds
+            totals['peak_bytes'] = max(totals['peak_bytes'], peak)
+            if self.current_student is not None:
+                record = self.current_student
+                record['stages'][name] = record['stages'].get(name, 0.0) + seconds
+                record['peak_bytes'] = max(record['peak_bytes'], peak)
+
+    @contextmanager
+    def student(self, student_file: str):
+        record = {'file': student_file, 'seconds': 0.0, 'peak_bytes': 0, 'stages': {}}
+        self.current_student = record
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self.current_student = None
+            self.students[student_file] = record
+
+    def slowest(self, count: int = 10) -> List[dict]:
+        """The count students that took longest to grade, slowest first."""
+        return sorted(self.students.values(), key=lambda record: record['seconds'], reverse=True)[:count]
+
+    def report(self) -> dict:
+        return {
+            'seconds': self.seconds,
+            'peak_bytes': self.peak_bytes,
+            'memory_traced': self.track_memory,
+            'stages': self.stages,
+            'slowest': self.slowest(),
+            'students': self.slowest(len(self.students)),
+        }
+
+    def write(self, path: str):
+        """Save the report as JSON."""
+        with open(path, 'w') as out:
+            json.dump(self.report(), out, indent=2)
+
+    def summary(self, count: int = 5) -> str:
+        """A short human-readable summary of the stages and the slowest students."""
+        lines = [f"Profiled {len(self.students)} students in {self.seconds:.2f}s "
+                 f"(peak traced memory {self.peak_bytes / 2**20:.1f} MiB)"]
+        for name, totals in sorted(self.stages.items(), key=lambda item: item[1]['seconds'], reverse=True):
+            lines.append(f"  {name:<14}{totals['seconds']:>9.3f}s  {totals['calls']:>6} calls  "
+                         f"peak {totals['peak_bytes'] / 2**20:.1f} MiB")
+        lines.append("Slowest submissions:")
+        for record in self.slowest(count):
+            lines.append(f"  {record['seconds']:>8.3f}s  {record['file']}")
+        return '\n'.join(lines)
@@ -0,0 +1,239 @@
+import os
+import gzip
+import json
+import hashlib
+import argparse
+from array import array
+from typing import Dict, Iterable, List, Optional, Tuple
+from typealong_grader import StreamingResultWriter, score_student
+
+# Mistake tags with a count, in the order the grader lists them
+CATEGORIES = ('SpacingErrors', 'NewLineErrors', 'ExtraCharacters', 'MissingCharacters', 'Comments', 'Brackets')
+# Every format results can be exported to, by file extension
+EXPORT_FORMATS = {'.csv': 'csv', '.tsv': 'tsv', '.jsonl': 'jsonl', '.json': 'json', '.xlsx': 'excel',
+                  '.parquet': 'parquet'}
+EXPORT_COLUMNS = ('Student Name', 'Score', 'Mistakes')
+SESSION_VERSION = 1
+
+def code_digest(code: Optional[str]) -> Optional[str]:
+    """A digest of a student's code, to tell later whether the file still holds what was graded."""
+    return None if code is None else hashlib.sha256(code.encode('utf-8', 'surrogatepass')).hexdigest()
+
+class ResultStore:
+    """A graded class kept as columns of raw results, so it can be rescored and exported without diffing again.
+
+    Each student has their name, path and number of mistakes (-1 for a file
+    that failed to grade), an integer column per mistake category, the
+    lines with misplaced braces, any other tags (ExceedsThreshold,
+    GradingError) and a digest of the code that was graded. Scores are not stored: scores() works them out for
+    whatever points are asked for. settings records how the class was
+    graded (source_code, student_directory, total_points,
+    points_per_mistake, ignore_comments, engine, bounded, max_edits).
+    """
+
+    def __init__(self, settings: dict = None):
+        self.settings = dict(settings or {})
+        self.names: List[str] = []
+        self.paths: List[str] = []
+        self.mistakes = array('q')
+        self.counts: Dict[str, array] = {category: array('q') for category in CATEGORIES}
+        self.bracket_lines: List[str] = []
+        self.flags: List[List[str]] = []
+        self.digests: List[Optional[str]] = []
+        self.rows: Dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def put(self, name: str, path: str, num_mistakes: Optional[int], mistake_tags: List[str],
+            digest: str = None) -> int:
+        """Store a student's (num_mistakes, mistake_tags), replacing any earlier result for the same path.
+
+        digest is the code_digest of the code that was graded, if known.
+        Returns the student's row.
+        """
+        counts = dict.fromkeys(CATEGORIES, 0)
+        bracket_lines = ''
+        flags = []
+        for tag in mistake_tags:
+            category, _, value = tag.partition(':')
+            if category in counts and value.isdigit():
+                counts[category] = int(value)
+            elif category == 'BracketLines':
+                bracket_lines = value
+            else:
+                flags.append(tag)
+
+        row = self.rows.get(path)
+        if row is None:
+            row = self.rows[path] = len(self.names)
+            self.names.append(name)
+            self.paths.append(path)
+            self.mistakes.append(-1 if num_mistakes is None else num_mistakes)
+            for category in CATEGORIES:
+                self.counts[category].append(counts[category])
+            self.bracket_lines.append(bracket_lines)
+            self.flags.append(flags)
+            self.digests.append(digest)
+            return row
+        self.names[row] = name
+        self.mistakes[row] = -1 if num_mistakes is None else num_mistakes
+        for category in CATEGORIES:
+            self.counts[category][row] = counts[category]
+        self.bracket_lines[row] = bracket_lines
+        self.flags[row] = flags
+        self.digests[row] = digest
+        return row
+
+    def remove(self, path: str):
+        """Drop a student's result, moving later students up a row."""
+        row = self.rows.pop(path, None)
+        if row is None:
+            return
+        for column in [self.names, self.paths, self.mistakes, self.bracket_lines, self.flags, self.digests,
+                       *self.counts.values()]:
+            del column[row]
+        self.rows = {path: i for i, path in enumerate(self.paths)}
+
+    def changed_since_grading(self, row: int, code: str) -> bool:
+        """Whether code is not what the student's row was graded from (False if that is not known)."""
+        return self.digests[row] is not None and code_digest(code) != self.digests[row]
+
+    def result(self, row: int) -> Tuple[Optional[int], List[str]]:
+        """A student's (num_mistakes, mistake_tags), as the grader gave them."""
+        tags = [f"{category}:{self.counts[category][row]}" for category in CATEGORIES[:-1]
+                if self.counts[category][row]]
+        tags.extend(self.flags[row])
+        if self.counts['Brackets'][row]:
+            tags.append(f"Brackets:{self.counts['Brackets'][row]}")
+        if self.bracket_lines[row]:
+            tags.append(f"BracketLines:{self.bracket_lines[row]}")
+        return (None if self.mistakes[row] < 0 else self.mistakes[row]), tags
+
+    def _points(self, total_points: float = None, points_per_mistake: float = None) -> Tuple[float, float]:
+        return (self.settings['total_points'] if total_points is None else total_points,
+                self.settings.get('points_per_mistake', 0.1) if points_per_mistake is None else points_per_mistake)
+
+    def grade(self, row: int, total_points: float = None,
+              points_per_mistake: float = None) -> Tuple[str, float, List[str]]:
+        """A student's (name, score, tags) row; the points default to the ones the class was graded with."""
+        total_points, points_per_mistake = self._points(total_points, points_per_mistake)
+        return score_student(self.names[row], *self.result(row), total_points, points_per_mistake)
+
+    def scores(self, total_points: float = None,
+               points_per_mistake: float = None) -> List[Tuple[str, float, List[str]]]:
+        """Every student's (name, score, tags) row, scored with the given points."""
+        return [self.grade(row, total_points, points_per_mistake) for row in range(len(self))]
+
+    def needs_regrading(self, total_points: float = None, points_per_mistake: float = None) -> List[int]:
+        """Rows whose score with these points cannot be known without diffing again.
+
+        Bounded grading stops counting once a student is certain to score 0,
+        so those students only have a lower bound on their mistakes. With a
+        smaller penalty they might no longer score 0, but they still do until
+        they are graded again.
+        """
+        total_points, points_per_mistake = self._points(total_points, points_per_mistake)
+        return [row for row in range(len(self))
+                if 'ExceedsThreshold' in self.flags[row]
+                and total_points - self.mistakes[row] * points_per_mistake > 0]
+
+    def export(self, path: str, output_format: str = None, total_points: float = None,
+               points_per_mistake: float = None, order: Iterable[int] = None):
+        """Write the scored results to a CSV, TSV, JSON Lines, JSON, Excel or Parquet file.
+
+        The format follows the file extension unless output_format is given,
+        and order lists the rows to write (default: all, in the order graded).
+        """
+        output_format = output_format or EXPORT_FORMATS.get(os.path.splitext(path)[1].lower(), 'csv')
+        scored = self.scores(total_points, points_per_mistake)
+        rows = [(name, score, ', '.join(mistakes))
+                for name, score, mistakes in (scored[row] for row in (range(len(self)) if order is None else order))]
+        if output_format in ('csv', 'tsv', 'jsonl'):
+            with StreamingResultWriter(path, EXPORT_COLUMNS, output_format) as writer:
+                for row in rows:
+                    writer.write(row)
+        elif output_format == 'json':
+            with open(path, 'w') as out:
+                json.dump([dict(zip(EXPORT_COLUMNS, row)) for row in rows], out, separators=(',', ':'))
+        elif output_format in ('excel', 'parquet'):
+            # pandas (with openpyxl or pyarrow) is slow to import, so it is only loaded for these formats
+            try:
+                import pandas as pd
+            except ImportError:
+                raise ImportError(f"Saving as {output_format.title()} needs pandas "
+                                  f"(pip install -r requirements.txt)") from None
+            df = pd.DataFrame(rows, columns=EXPORT_COLUMNS)
+            if output_format == 'excel':
+                df.to_excel(path, index=False)
+            else:
+                df.to_parquet(path, index=False)
+        else:
+            raise ValueError(f"Unknown export format: {output_format}")
+
+    def save(self, path: str):
+        """Save the results and settings to a session file (gzip-compressed JSON, one list per column)."""
+        columns = {'StudentName': self.names, 'Path': self.paths, 'Mistakes': self.mistakes.tolist(),
+                   'BracketLines': self.bracket_lines, 'Flags': self.flags, 'Digest': self.digests}
+        columns.update((category, counts.tolist()) for category, counts in self.counts.items())
+        with gzip.open(path, 'wt', encoding='utf-8') as out:
+            json.dump({'version': SESSION_VERSION, 'settings': self.settings, 'columns': columns}, out,
+                      separators=(',', ':'))
+
+    @classmethod
+    def load(cls, path: str) -> 'ResultStore':
+        """Read a session file written by save."""
+        with gzip.open(path, 'rt', encoding='utf-8') as src:
+            session = json.load(src)
+        if session.get('version') != SESSION_VERSION:
+            raise ValueError(f"{path} is a session file from an incompatible version of the grader")
+        columns = session['columns']
+        store = cls(session['settings'])
+        store.names = columns['StudentName']
+        store.paths = columns['Path']
+        store.mistakes = array('q', columns['Mistakes'])
+        store.counts = {category: array('q', columns[category]) for category in CATEGORIES}
+        store.bracket_lines = columns['BracketLines']
+        store.flags = columns['Flags']
+        # Sessions saved before digests were kept cannot tell whether a file changed
+        store.digests = columns.get('Digest') or [None] * len(store.names)
+        store.rows = {path: i for i, path in enumerate(store.paths)}
+        return store
+
+def main():
+    """Rescore and export a saved grading session without diffing again."""
+    parser = argparse.ArgumentParser(description="Export the results of a saved grading session")
+    parser.add_argument("session", help="Session file saved by the grader (--session) or the GUI")
+    parser.add_argument("--output", required=True,
+                        help="File to export to; the format follows the extension "
+                             "(.csv, .tsv, .jsonl, .json, .xlsx or .parquet)")
+    parser.add_argument("--total_points", type=float, default=None,
+                        help="Total points to score with (default: the ones the session was graded with)")
+    parser.add_argument("--points_per_mistake", type=float, default=None,
+                        help="Points deducted per mistake (default: the ones the session was graded with)")
+    parser.add_argument("--sort", choices=["name", "score", "mistakes"], default=None,
+                        help="Sort the exported rows (default: the order they were graded in)")
+    parser.add_argument("--descending", action="store_true", help="Sort from highest to lowest")
+
+    args = parser.parse_args()
+
+    store = ResultStore.load(args.session)
+    order = None
+    if args.sort == 'name':
+        order = sorted(range(len(store)), key=store.names.__getitem__, reverse=args.descending)
+    elif args.sort == 'score':
+        scored = store.scores(args.total_points, args.points_per_mistake)
+        order = sorted(range(len(store)), key=lambda row: scored[row][1], reverse=args.descending)
+    elif args.sort == 'mistakes':
+        order = sorted(range(len(store)), key=store.mistakes.__getitem__, reverse=args.descending)
+    store.export(args.output, total_points=args.total_points, points_per_mistake=args.points_per_mistake,
+                 order=order)
+
+    stale = store.needs_regrading(args.total_points, args.points_per_mistake)
+    if stale:
+        print(f"Warning: {len(stale)} students were graded with --bounded and could score above 0 with these "
+              f"points; they still score 0 until they are graded again without it")
+    print(f"Exported {len(store)} students to {args.output}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+import os
+import json
+import stat
+import time
+import signal
+import socket
+import socketserver
+import argparse
+import ipaddress
+import threading
+import http.client
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List, Optional, Tuple
+from urllib.parse import urlparse
+from typealong_grader import (DIFF_ENGINE_HELP, DIFF_ENGINES, PreparedReference, add_grading_options,
+                              find_java_files, grade_chunk, init_worker, iter_grades, read_student_file,
+                              student_name_from_code)
+
+# Prepared references kept between requests, most recently used last
+MAX_REFERENCES = 32
+# Largest request body accepted, which bounds the code a request can upload
+MAX_REQUEST_BYTES = 64 * 1024 * 1024
+
+def _init_service_worker():
+    # Ctrl+C reaches the workers too; the service shuts them down itself
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    init_worker({})
+
+class GradingService:
+    """Grades requests on a process pool and with prepared references that stay alive between requests.
+
+    At most queue_size requests are graded or waiting at once; grade()
+    returns None straight away for any more, so callers are told to back off
+    instead of piling up behind a full pool. Requests share the pool's
+    workers, and their chunks are graded in the order they were submitted.
+    Requests can only name files inside roots (default: the current
+    directory), so a caller cannot have the service read anything else
+    its account can.
+    """
+
+    def __init__(self, engine: str = 'linear', jobs: int = 0, queue_size: int = 16, roots: List[str] = None):
+        self.roots = [os.path.realpath(root) for root in (roots or [os.getcwd()])]
+        self.engine = engine
+        self.jobs = jobs or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.slots = threading.BoundedSemaphore(queue_size)
+        self.active = 0
+        self.graded = 0
+        self.restarts = 0
+        self.lock = threading.Lock()
+        self.references = OrderedDict()
+        self.executor = self._start_pool()
+
+    def _start_pool(self):
+        # Only imported here, like the grader does, since multiprocessing is slow to import
+        from concurrent.futures import ProcessPoolExecutor
+
+        executor = ProcessPoolExecutor(max_workers=self.jobs, initializer=_init_service_worker)
+        # Start every worker now, so the first request does not pay for it
+        for future in [executor.submit(grade_chunk, [], {}) for _ in range(self.jobs)]:
+            future.result()
+        return executor
+
+    def pool(self):
+        """The worker pool, replaced first if a worker process died and took it down.
+
+        A request that was grading when it happened finishes on fresh
+        processes of its own (see typealong_grader._iter_graded).
+        """
+        from concurrent.futures.process import BrokenProcessPool
+
+        with self.lock:
+            try:
+                # Submitting fails straight away on a broken pool
+                self.executor.submit(grade_chunk, [], {})
+            except BrokenProcessPool:
+                self.executor.shutdown(wait=False)
+                self.executor = self._start_pool()
+                self.restarts += 1
+            return self.executor
+
+    def allowed(self, path: str) -> str:
+        """path with symbolic links resolved, if it is inside one of the roots; raises PermissionError otherwise."""
+        real = os.path.realpath(path)
+        if not any(os.path.commonpath([root, real]) == root for root in self.roots):
+            raise PermissionError(f"{path} is outside the directories this service grades")
+        return real
+
+    def reference(self, path: str, ignore_comments: str) -> PreparedReference:
+        """The prepared reference at path, prepared again only if the file has changed since."""
+        path = self.allowed(path)
+        version = os.stat(path)
+        version = (version.st_mtime_ns, version.st_size)
+        key = (path, ignore_comments)
+        with self.lock:
+            held = self.references.get(key)
+            if held is not None and held[0] == version:
+                self.references.move_to_end(key)
+                return held[1]
+        reference = PreparedReference.load(path, ignore_comments)
+        with self.lock:
+            self.references[key] = (version, reference)
+            self.references.move_to_end(key)
+            while len(self.references) > MAX_REFERENCES:
+                self.references.popitem(last=False)
+        return reference
+
+    def grade(self, request: dict) -> Optional[List[Tuple[str, float, List[str]]]]:
+        """Grade one request, returning the (name, score, tags) rows grade_typealong would, in the same order.
+
+        The request has source_code (a path), total_points and either
+        student_directory or students, a list of objects with a path and
+        optionally the code and the student's name (default: from the code's
+        header). It may also set points_per_mistake, ignore_comments,
+        diff_engine, bounded, max_edits, include, exclude and max_file_size as
+        the grader's options do. Returns None if the queue is full. Raises
+        ValueError for a malformed request, PermissionError for files outside
+        the roots and OSError for files that cannot be read. Paths of
+        students whose code is sent are only used to tell them apart.
+        """
+        if not self.slots.acquire(blocking=False):
+            return None
+        try:
+            with self.lock:
+                self.active += 1
+            try:
+                source_code = request['source_code']
+                total_points = float(request['total_points'])
+                points_per_mistake = float(request.get('points_per_mistake', 0.1))
+                max_edits = None if request.get('max_edits') is None else int(request['max_edits'])
+            except KeyError as e:
+                raise ValueError(f"Request is missing {e}") from None
+            except (TypeError, ValueError) as e:
+                raise ValueError(f"Request is invalid: {e}") from None
+            bounded = request.get('bounded', False)
+            if not isinstance(bounded, bool):
+                raise ValueError("bounded must be true or false")
+            for option in ('include', 'exclude'):
+                patterns = request.get(option)
+                if patterns is not None and not (isinstance(patterns, list)
+                                                 and all(isinstance(pattern, str) for pattern in patterns)):
+                    raise ValueError(f"{option} must be a list of glob patterns")
+            max_file_size = request.get('max_file_size')
+            if max_file_size is not None and (isinstance(max_file_size, bool) or not isinstance(max_file_size, int)):
+                raise ValueError("max_file_size must be a whole number of bytes")
+            ignore_comments = request.get('ignore_comments', 'eol')
+            engine = request.get('diff_engine', self.engine)
+            if engine not in DIFF_ENGINES:
+                raise ValueError(f"Unknown diff engine: {engine}")
+
+            if 'students' in request:
+                if not isinstance(request['students'], list):
+                    raise ValueError("students must be a list")
+                student_files = []
+                for student in request['students']:
+                    if not isinstance(student, dict) or 'path' not in student:
+                        raise ValueError("Every student needs a path")
+                    code = student.get('code')
+                    name = student.get('name') or (student_name_from_code(code) if code is not None else None)
+                    if code is None:
+                        self.allowed(student['path'])
+                        student_files.append((name, student['path']) if name else read_student_file(student['path']))
+                    else:
+                        student_files.append((name, student['path'], code))
+            elif 'student_directory' in request:
+                if not os.path.isdir(self.allowed(request['student_directory'])):
+                    raise ValueError(f"{request['student_directory']} is not a directory")
+                student_files = find_java_files(request['student_directory'], request.get('include') or ['*.java'],
+                                                request.get('exclude') or [], max_file_size)
+                # A linked file can point outside the roots even when the directory is inside them
+                for entry in student_files:
+                    self.allowed(entry[1])
+            else:
+                raise ValueError("Request needs student_directory or students")
+
+            reference = self.reference(source_code, ignore_comments)
+            work = [(reference, entry, total_points, points_per_mistake) for entry in student_files]
+            grades = [None] * len(work)
+            for i, grade in iter_grades(work, engine, self.jobs, bounded=bounded,
+                                        max_edits=max_edits, executor=self.pool()):
+                grades[i] = grade
+            with self.lock:
+                self.graded += len(grades)
+            return grades
+        finally:
+            with self.lock:
+                self.active -= 1
+            self.slots.release()
+
+    def status(self) -> dict:
+        with self.lock:
+            return {'jobs': self.jobs, 'queue_size': self.queue_size, 'active': self.active,
+                    'graded': self.graded, 'references': len(self.references), 'restarts': self.restarts}
+
+    def close(self):
+        self.executor.shutdown()
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server_version = 'TypeAlongGrader'
+
+    def send_json(self, status: int, body: dict, headers: dict = None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        for header, value in (headers or {}).items():
+            self.send_header(header, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/status':
+            self.send_json(200, self.server.service.status())
+        else:
+            self.send_json(404, {'error': f"No such endpoint: {self.path}"})
+
+    def do_POST(self):
+        if self.path != '/grade':
+            self.send_json(404, {'error': f"No such endpoint: {self.path}"})
+            return
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            self.send_json(400, {'error': "Content-Length must be a number"})
+            return
+        if length > MAX_REQUEST_BYTES:
+            self.send_json(413, {'error': f"Requests are limited to {MAX_REQUEST_BYTES} bytes"})
+            return
+        try:
+            request = json.loads(self.rfile.read(length))
+            if not isinstance(request, dict):
+                raise ValueError("Request must be a JSON object")
+            grades = self.server.service.grade(request)
+        except PermissionError as e:
+            self.send_json(403, {'error': str(e)})
+            return
+        except (ValueError, OSError) as e:
+            self.send_json(400, {'error': str(e)})
+            return
+        except Exception as e:
+            # Anything else is a bug or a broken pool, but the client still gets an answer
+            self.log_error("Grading failed: %r", e)
+            self.send_json(500, {'error': f"Grading failed: {type(e).__name__}: {e}"})
+            return
+        if grades is None:
+            self.send_json(503, {'error': "Grading queue is full"}, {'Retry-After': '1'})
+        else:
+            self.send_json(200, {'results': grades})
+
+    def address_string(self):
+        # Unix socket clients have no address
+        return self.client_address[0] if self.client_address else 'local'
+
+    def log_message(self, format, *args):
+        if not self.server.quiet:
+            super().log_message(format, *args)
+
+class UnixHTTPServer(ThreadingHTTPServer):
+    """An HTTP server listening on a Unix socket, so only users who can open that file can reach it."""
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        # A socket left behind by a service that did not shut down cleanly is replaced
+        try:
+            if stat.S_ISSOCK(os.stat(self.server_address).st_mode):
+                os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+        socketserver.TCPServer.server_bind(self)
+        self.server_name = 'localhost'
+        self.server_port = 0
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+def make_server(service: GradingService, host: str = '127.0.0.1', port: int = 8765, unix_socket: str = None,
+                quiet: bool = False) -> ThreadingHTTPServer:
+    """An HTTP server for the service, on host and port or on a Unix socket; call serve_forever() to run it."""
+    if unix_socket:
+        server = UnixHTTPServer(unix_socket, _RequestHandler)
+    else:
+        server = ThreadingHTTPServer((host, port), _RequestHandler)
+    server.service = service
+    server.quiet = quiet
+    return server
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, path: str, timeout: float = None):
+        super().__init__('localhost', timeout=timeout)
+        self.unix_socket = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_socket)
+
+class GradingClient:
+    """Sends grading requests to a running service at an http://host:port URL or a Unix socket path.
+
+    When the service's queue is full, the request is sent again after the
+    delay the service asks for, up to retries times.
+    """
+
+    def __init__(self, address: str = 'http://127.0.0.1:8765', retries: int = 30, timeout: float = None):
+        self.address = address
+        self.retries = retries
+        self.timeout = timeout
+
+    def _connection(self) -> http.client.HTTPConnection:
+        if self.address.startswith(('http://', 'https://')):
+            url = urlparse(self.address)
+            return http.client.HTTPConnection(url.hostname, url.port or 80, timeout=self.timeout)
+        return _UnixHTTPConnection(self.address, timeout=self.timeout)
+
+    def _call(self, method: str, path: str, body: dict = None) -> dict:
+        data = None if body is None else json.dumps(body).encode()
+        for attempt in range(self.retries + 1):
+            connection = self._connection()
+            try:
+                connection.request(method, path, data, {'Content-Type': 'application/json'} if data else {})
+                response = connection.getresponse()
+                reply = json.loads(response.read() or b'{}')
+                retry_after = float(response.getheader('Retry-After') or 1)
+            finally:
+                connection.close()
+            if response.status == 200:
+                return reply
+            if response.status != 503 or attempt == self.retries:
+                raise RuntimeError(f"Grading service error ({response.status}): {reply.get('error')}")
+            time.sleep(retry_after)
+
+    def grade(self, source_code: str, total_points: float, student_directory: str = None,
+              students: List[dict] = None, **options) -> List[Tuple[str, float, List[str]]]:
+        """Grade a directory or a list of students; see GradingService.grade for the options."""
+        request = dict(options, source_code=os.path.abspath(source_code), total_points=total_points)
+        if students is not None:
+            request['students'] = students
+        else:
+            request['student_directory'] = os.path.abspath(student_directory)
+        return [(name, score, tags) for name, score, tags in self._call('POST', '/grade', request)['results']]
+
+    def status(self) -> dict:
+        return self._call('GET', '/status')
+
+def main():
+    """Run the grading service, or send it a request from the command line."""
+    parser = argparse.ArgumentParser(description="Grade type-alongs with a long-running local service")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="Start the service and keep it running until Ctrl+C")
+    serve.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1)")
+    serve.add_argument("--port", type=int, default=8765, help="Port to listen on (default: 8765)")
+    serve.add_argument("--socket", default=None, help="Listen on this Unix socket instead of a port")
+    serve.add_argument("--root", action="append", default=None, metavar="DIRECTORY",
+                       help="Only grade files inside this directory; may be repeated (default: the current directory)")
+    serve.add_argument("--diff_engine", choices=sorted(DIFF_ENGINES), default="linear",
+                       help=f"Diff implementation for requests that do not ask for one: {DIFF_ENGINE_HELP} "
+                            f"(default: linear)")
+    serve.add_argument("--jobs", type=int, default=0,
+                       help="Number of worker processes, 0 for all cores (default: 0)")
+    serve.add_argument("--queue_size", type=int, default=16,
+                       help="Requests graded or waiting at once; more are told to retry later (default: 16)")
+    serve.add_argument("--quiet", action="store_true", help="Do not log each request")
+
+    grade = commands.add_parser("grade", help="Grade a directory with a running service")
+    grade.add_argument("source_code", help="Path to the source code (teacher's code)")
+    grade.add_argument("student_directory", help="Path to the directory containing student code")
+    grade.add_argument("total_points", type=float, help="Total points for the type-along")
+    grade.add_argument("--service", default="http://127.0.0.1:8765",
+                       help="URL or Unix socket path of the service (default: http://127.0.0.1:8765)")
+    grade.add_argument("--points_per_mistake", type=float, default=0.1,
+                       help="Points deducted per mistake (default: 0.1)")
+    grade.add_argument("--ignore_comments", type=str, default="eol")
+    add_grading_options(grade, local=False)
+    grade.add_argument("--output", default="typealong-graded.csv",
+                       help="Path to the output CSV file (default: typealong-graded.csv)")
+
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        if not args.socket and not ipaddress.ip_address(socket.gethostbyname(args.host)).is_loopback:
+            print(f"Warning: the service has no authentication, so anyone who can reach {args.host} can "
+                  f"grade files under {', '.join(args.root or [os.getcwd()])} and see their first lines")
+        service = GradingService(args.diff_engine, args.jobs, args.queue_size, args.root)
+        server = make_server(service, args.host, args.port, args.socket, args.quiet)
+        print(f"Grading on {service.jobs} workers at "
+              f"{args.socket or f'http://{args.host}:{server.server_port}'} (Ctrl+C to stop)")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            service.close()
+        return
+
+    from typealong_grader import StreamingResultWriter
+
+    client = GradingClient(args.service)
+    grades = client.grade(args.source_code, args.total_points, args.student_directory,
+                          points_per_mistake=args.points_per_mistake, ignore_comments=args.ignore_comments,
+                          diff_engine=args.diff_engine, bounded=args.bounded, max_edits=args.max_edits,
+                          include=args.include, exclude=args.exclude, max_file_size=args.max_file_size)
+    with StreamingResultWriter(args.output, output_format=args.format) as writer:
+        for grade in grades:
+            writer.write(grade)
+    print(f"Grading complete. Results saved to {args.output}")
+
+if __name__ == "__main__":
+    main()
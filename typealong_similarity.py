@@ -0,0 +1,141 @@
+import re
+import zlib
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from typealong_grader import preprocess_java_code, read_student_file
+
+# A statement runs up to the next ; { or }, so brace style and line breaks do not change it
+_STATEMENTS = re.compile(r'[^;{}]*[;{}]|[^;{}]+$')
+_WHITESPACE = re.compile(r'\s+')
+
+def _kgram_hashes(text: str, k: int) -> List[int]:
+    return [zlib.crc32(text[i:i + k].encode('utf-8', 'surrogatepass')) for i in range(len(text) - k + 1)]
+
+def winnow(hashes: List[int], window: int) -> Set[int]:
+    """Keep the smallest hash of every window consecutive hashes, so any shared run that long shares one."""
+    if len(hashes) <= window:
+        return {min(hashes)} if hashes else set()
+    return {min(hashes[start:start + window]) for start in range(len(hashes) - window + 1)}
+
+class SimilarityIndex:
+    """Finds students who share the same unusual deviations from the reference, without comparing every pair.
+
+    Each submission is reduced to fingerprints of where it differs from the
+    reference: the statements (with whitespace removed) that the reference
+    does not have are winnowed into k-gram hashes, leaving out k-grams the
+    reference contains. Comments are kept whatever the grading level: a
+    shared comment is evidence too, and after a student breaks a comment
+    marker, stripping comments would change everything after it in the
+    same way for everyone who did. Fingerprints held by more than max_share of the
+    class are common mistakes rather than evidence, so only rarer ones are
+    indexed, and only students sharing one are ever compared. Two students
+    are similar when they share at least min_shared deviations with rare
+    fingerprints, and those make up at least min_overlap of the rare
+    deviations of whichever student has fewer. A single shared mistake is
+    often coincidence; several rarely are.
+    """
+
+    def __init__(self, reference_code: str, k: int = 8, window: int = 4, min_shared: int = 3,
+                 min_overlap: float = 0.75, max_share: float = 0.1):
+        self.k = k
+        self.window = window
+        self.min_shared = min_shared
+        self.min_overlap = min_overlap
+        self.max_share = max_share
+        compact = _WHITESPACE.sub('', preprocess_java_code(reference_code))
+        self.reference_statements = set(_STATEMENTS.findall(compact))
+        self.reference_kgrams = set(_kgram_hashes(compact, k))
+        self.fingerprints: List[Dict[int, int]] = []
+
+    def fingerprint(self, code: str) -> Dict[int, int]:
+        """Fingerprints of the parts of a student's code that differ from the reference.
+
+        Maps each fingerprint to the number of the deviation (run of
+        differing statements) it came from.
+        """
+        compact = _WHITESPACE.sub('', preprocess_java_code(code))
+        # (start, end) of each run of statements the reference does not have
+        spans = []
+        pos = 0
+        for statement in _STATEMENTS.findall(compact):
+            end = pos + len(statement)
+            if statement not in self.reference_statements:
+                if spans and spans[-1][1] == pos:
+                    spans[-1] = (spans[-1][0], end)
+                else:
+                    spans.append((pos, end))
+            pos = end
+
+        fingerprints = {}
+        for deviation, (start, end) in enumerate(spans):
+            # A little context either side gives a mistake at the edge of a span as many k-grams as any other
+            text = compact[max(0, start - self.k + 1):end + self.k - 1]
+            for fingerprint in winnow([h for h in _kgram_hashes(text, self.k) if h not in self.reference_kgrams],
+                                      self.window):
+                fingerprints.setdefault(fingerprint, deviation)
+        return fingerprints
+
+    def add(self, code: Optional[str]) -> int:
+        """Index a student's code (None for a file that could not be read), returning their index."""
+        self.fingerprints.append(self.fingerprint(code) if code is not None else {})
+        return len(self.fingerprints) - 1
+
+    def similar_pairs(self) -> List[Tuple[int, int, int]]:
+        """(student, other student, rare deviations shared) for every pair of similar students."""
+        students_with = defaultdict(list)
+        for student, fingerprints in enumerate(self.fingerprints):
+            for fingerprint in fingerprints:
+                students_with[fingerprint].append(student)
+        max_students = max(2, int(self.max_share * len(self.fingerprints)))
+
+        # Deviations with a rare fingerprint, per student, and those shared, per pair
+        rare = [set() for _ in self.fingerprints]
+        shared = defaultdict(set)
+        for fingerprint, students in students_with.items():
+            if len(students) > max_students:
+                continue
+            for student in students:
+                rare[student].add(self.fingerprints[student][fingerprint])
+            for i in range(len(students)):
+                for j in range(i + 1, len(students)):
+                    shared[students[i], students[j]].add(self.fingerprints[students[i]][fingerprint])
+
+        return sorted((a, b, len(deviations)) for (a, b), deviations in shared.items()
+                      if len(deviations) >= self.min_shared
+                      and len(deviations) >= self.min_overlap * min(len(rare[a]), len(rare[b])))
+
+    def clusters(self) -> List[List[int]]:
+        """Groups of students linked by similar pairs, each in index order, ordered by first student."""
+        parent = list(range(len(self.fingerprints)))
+
+        def root(student):
+            while parent[student] != student:
+                parent[student] = parent[parent[student]]
+                student = parent[student]
+            return student
+
+        for a, b, _ in self.similar_pairs():
+            parent[max(root(a), root(b))] = min(root(a), root(b))
+        groups = defaultdict(list)
+        for student in range(len(parent)):
+            groups[root(student)].append(student)
+        return sorted(group for group in groups.values() if len(group) > 1)
+
+    def labels(self) -> List[Optional[int]]:
+        """Each student's cluster number (counting from 1), or None for students in no cluster."""
+        labels = [None] * len(self.fingerprints)
+        for number, group in enumerate(self.clusters(), 1):
+            for student in group:
+                labels[student] = number
+        return labels
+
+def similarity_groups(reference_code: str, student_files: Iterable[tuple], **settings) -> List[Optional[int]]:
+    """Cluster numbers for (name, path[, code]) entries, as SimilarityIndex.labels gives them.
+
+    settings are passed on to SimilarityIndex. Files whose code was not read
+    with them are read here.
+    """
+    index = SimilarityIndex(reference_code, **settings)
+    for entry in student_files:
+        index.add(entry[2] if len(entry) > 2 else read_student_file(entry[1])[2])
+    return index.labels()
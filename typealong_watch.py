@@ -0,0 +1,107 @@
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+from typealong_cache import GradingCache
+from typealong_grader import (PreparedReference, StreamingResultWriter, iter_mistakes, read_student_file,
+                              scan_java_files)
+from typealong_results import ResultStore, code_digest
+
+def write_results(path: str, rows: Iterable[tuple], columns: List[str] = ("StudentName", "Score", "Mistakes"),
+                  output_format: str = None):
+    """Replace the results file at path in one step, so nobody reading it sees half a file."""
+    output_format = output_format or StreamingResultWriter.FORMATS.get(os.path.splitext(path)[1].lower(), 'csv')
+    temporary = f"{path}.tmp"
+    with StreamingResultWriter(temporary, columns, output_format) as writer:
+        for row in rows:
+            writer.write(row)
+    os.replace(temporary, path)
+
+class SubmissionWatcher:
+    """Regrades the files in a student directory that are new or changed since the last poll.
+
+    The reference is prepared once and kept for as long as the watcher is,
+    and a file counts as changed when its modification time or size does.
+    A file caught half-saved is simply graded again on the next poll. The
+    latest results are kept in store, which can be saved as a session.
+    """
+
+    def __init__(self, source_code: Union[str, PreparedReference], student_directory: str, total_points: float,
+                 points_per_mistake: float = 0.1, ignore_comments: str = 'eol', engine: str = 'linear',
+                 jobs: int = 1, cache: GradingCache = None, bounded: bool = False, max_edits: int = None,
+                 include: Iterable[str] = ('*.java',), exclude: Iterable[str] = (), max_size: int = None):
+        reference_path = None
+        if isinstance(source_code, PreparedReference):
+            self.reference = source_code
+        else:
+            self.reference = PreparedReference.load(source_code, ignore_comments)
+            reference_path = os.path.abspath(source_code)
+        self.student_directory = student_directory
+        self.total_points = total_points
+        self.points_per_mistake = points_per_mistake
+        self.engine = engine
+        self.jobs = jobs
+        self.cache = cache
+        self.bounded = bounded
+        self.max_edits = max_edits
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self.max_size = max_size
+        # (modification time, size) each file had when it was last graded
+        self.signatures: Dict[str, Tuple[int, int]] = {}
+        self.store = ResultStore({'source_code': reference_path,
+                                  'student_directory': os.path.abspath(student_directory),
+                                  'total_points': total_points, 'points_per_mistake': points_per_mistake,
+                                  'ignore_comments': self.reference.ignore_comments, 'engine': engine,
+                                  'bounded': bounded, 'max_edits': max_edits})
+        self.order: List[str] = []
+
+    def _snapshot(self) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for path in scan_java_files(self.student_directory, self.include, self.exclude, self.max_size):
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue  # Deleted between the scan and the stat
+            snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def poll(self) -> Iterator[Tuple[str, Optional[tuple]]]:
+        """Grade new and changed files, yielding (path, grade) as each finishes.
+
+        Files that were removed are yielded as (path, None). Closing the
+        generator early leaves the files not yet graded for the next poll.
+        """
+        snapshot = self._snapshot()
+        self.order = list(snapshot)
+        for path in [path for path in self.signatures if path not in snapshot]:
+            del self.signatures[path]
+            self.store.remove(path)
+            yield path, None
+
+        changed = [path for path, signature in snapshot.items() if self.signatures.get(path) != signature]
+        if not changed:
+            return
+        work = [(self.reference, read_student_file(path), self.total_points, self.points_per_mistake)
+                for path in changed]
+        results = iter_mistakes(work, self.engine, self.jobs, self.cache, self.bounded, self.max_edits)
+        try:
+            for i, (num_mistakes, mistake_tags) in results:
+                path = changed[i]
+                self.signatures[path] = snapshot[path]
+                row = self.store.put(work[i][1][0], path, num_mistakes, mistake_tags, code_digest(work[i][1][2]))
+                yield path, self.store.grade(row)
+        finally:
+            results.close()
+
+    def results(self) -> List[tuple]:
+        """Every student's latest grade, in the order the files were found."""
+        return [self.store.grade(self.store.rows[path]) for path in self.order if path in self.store.rows]
+
+    def watch(self, interval: float = 0.5) -> Iterator[List[Tuple[str, Optional[tuple]]]]:
+        """Poll every interval seconds forever, yielding the changes from each poll that found any."""
+        while True:
+            started = time.monotonic()
+            changes = list(self.poll())
+            if changes:
+                yield changes
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))